@@ -0,0 +1,12 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+连接池和ORM热点路径的基准测试，使用方法见 run.py
+"""
+
+from . import dict_shim
+
+dict_shim.install()
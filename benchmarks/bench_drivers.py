@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+不同驱动(pymysql / mysqlclient)解析结果集的吞吐，需要真实的MySQL服务，通过环境变量配置:
+    ORM_BENCH_MYSQL_HOST=127.0.0.1 ORM_BENCH_MYSQL_USER=root ORM_BENCH_MYSQL_PASSWORD=... \\
+    ORM_BENCH_MYSQL_DATABASE=test python -m benchmarks.run -k drivers
+没有设置ORM_BENCH_MYSQL_HOST时跳过，没有安装的驱动也会跳过
+会在指定的库里创建并删除 bench_driver_rows 表
+"""
+
+import os
+import sys
+
+from libs.database.db_engine import create_engine
+from libs.database.database import DB
+from libs.database.connect_pool.drivers import get_driver
+
+from .harness import bench
+
+TABLE = 'bench_driver_rows'
+
+_CREATE = '''create table if not exists `%s` (
+    `id` int not null primary key,
+    `name` varchar(64) not null,
+    `email` varchar(128) not null,
+    `score` double not null,
+    `created` datetime not null,
+    `remark` text
+)''' % TABLE
+
+
+def _config():
+    host = os.environ.get('ORM_BENCH_MYSQL_HOST')
+    if not host:
+        return None
+    return dict(host=host,
+                port=int(os.environ.get('ORM_BENCH_MYSQL_PORT', 3306)),
+                user=os.environ.get('ORM_BENCH_MYSQL_USER', 'root'),
+                password=os.environ.get('ORM_BENCH_MYSQL_PASSWORD', ''),
+                database=os.environ.get('ORM_BENCH_MYSQL_DATABASE', 'test'))
+
+
+def _drivers():
+    for name in ('pymysql', 'mysqldb'):
+        try:
+            yield name, get_driver(name)
+        except ImportError as err:
+            print('skip driver %s: %s' % (name, err), file=sys.stderr)
+
+
+def _fill(db, rows):
+    db.execute(_CREATE)
+    db.execute('delete from `%s`' % TABLE)
+    values = [(i, 'user%d' % i, 'user%d@example.com' % i, i * 0.5, '2020-01-01 00:00:00', 'remark %d' % i)
+              for i in range(1, rows + 1)]
+    db.insert_many(TABLE, ['id', 'name', 'email', 'score', 'created', 'remark'], values)
+
+
+def run(options):
+    config = _config()
+    if config is None:
+        print('skip bench_drivers: ORM_BENCH_MYSQL_HOST is not set', file=sys.stderr)
+        return
+
+    rows = 1000 if options.quick else 10000
+    n = 5 if options.quick else 30
+    filled = None
+    for name, driver in _drivers():
+        for use_dict_cursor in (False, True):
+            pool_name = 'bench-driver-%s-%s' % (name, use_dict_cursor)
+            db = DB(create_engine(pool_name=pool_name, driver=driver, use_dict_cursor=use_dict_cursor,
+                                  max_pool_size=2, pool_resize_boundary=2, **config))
+            if filled is None:
+                _fill(db, rows)
+                filled = db
+            label = '%s %s cursor' % (name, 'dict' if use_dict_cursor else 'tuple')
+
+            def select_all():
+                db.select('select * from `%s`' % TABLE)
+
+            yield bench('driver %s: select %d rows' % (label, rows), select_all, n=n, items=rows, alloc_samples=2)
+
+    if filled is not None:
+        filled.execute('drop table `%s`' % TABLE)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+ORM热点路径:
+    1. 行物化: DBBase.query 生成Dict，以及Dict => Model
+    2. insert 与 insert_many / batch 的每行开销
+    3. join_by 随数据量的变化
+"""
+
+import libs.database
+from libs.database.database import DB
+
+from .fake_mysql import FakeServer, fake_engine
+from .harness import bench
+
+ROWS = 1000
+
+
+def _setup(options):
+    """
+    Model没有指定__database__时使用libs.database.db
+    """
+    server = FakeServer(options.latency)
+    db = DB(fake_engine(server, pool_name='bench-orm'))
+    libs.database.db = db
+
+    from libs.database.model import Model
+    from libs.database.field import IntegerField, StringField, FloatField
+
+    class BenchUser(Model):
+        __table__ = 'bench_user'
+        __timestamp_field__ = False
+        id = IntegerField(primary_key=True)
+        name = StringField()
+        email = StringField()
+        score = FloatField()
+        org_id = IntegerField()
+
+    class BenchOrg(Model):
+        __table__ = 'bench_org'
+        __timestamp_field__ = False
+        id = IntegerField(primary_key=True)
+        name = StringField()
+
+    return server, db, BenchUser, BenchOrg
+
+
+def _users(n, org_count=1):
+    return [dict(id=i, name='user%d' % i, email='user%d@example.com' % i, score=i * 0.5, org_id=i % org_count + 1)
+            for i in range(1, n + 1)]
+
+
+def run(options):
+    n = 20 if options.quick else 200
+    server, db, BenchUser, BenchOrg = _setup(options)
+
+    server.create_table('bench_user', _users(ROWS))
+    yield bench('DBBase.query %d rows -> Dict' % ROWS, lambda: db.select('select * from `bench_user`'),
+                n=n, items=ROWS)
+    yield bench('find_all %d rows -> Model' % ROWS, BenchUser.find_all, n=n, items=ROWS)
+
+    rows = db.select('select * from `bench_user`')
+    yield bench('Model(**Dict) x%d' % ROWS, lambda: [BenchUser(**d) for d in rows], n=n, items=ROWS)
+
+    def new_user():
+        return BenchUser(name='new', email='new@example.com', score=1.0, org_id=1)
+
+    server.create_table('bench_user')
+    yield bench('Model.insert() per row', lambda: new_user().insert(), n=n * 10)
+
+    batch_size = 100
+    yield bench('Model.insert_many() x%d per row' % batch_size,
+                lambda: BenchUser.insert_many([new_user() for _ in range(batch_size)]), n=n, items=batch_size)
+
+    def batch_insert():
+        with db.batch() as b:
+            for _ in range(batch_size):
+                b.insert('bench_user', name='new', email='new@example.com', score=1.0, org_id=1)
+
+    yield bench('DB.batch() insert x%d per row' % batch_size, batch_insert, n=n, items=batch_size)
+
+    for size in (10, 100, 1000):
+        server.create_table('bench_org', [dict(id=i, name='org%d' % i) for i in range(1, size + 1)])
+        users = _users(size, size)
+        yield bench('join_by %d x %d' % (size, size), lambda: BenchOrg.join_by(users, 'org_id', 'id'),
+                    n=max(n * 10 // size, 3), items=size)
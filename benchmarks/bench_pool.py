@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+连接池借出/归还的吞吐，分别在1/8/64个线程下测试，sticky表示开启了线程本地的快速路径
+"""
+
+from .fake_mysql import FakeServer, FakeConnectionPool
+from .harness import bench
+
+
+def run(options):
+    n = 2000 if options.quick else 20000
+    server = FakeServer(options.latency)
+
+    for threads, sticky in ((1, False), (8, False), (64, False), (64, True)):
+        pool = FakeConnectionPool(server, pool_name='bench-pool-%d-%s' % (threads, sticky),
+                                  max_pool_size=threads, pool_resize_boundary=threads,
+                                  sticky_connections=sticky)
+        label = 'x%d threads%s' % (threads, ' sticky' if sticky else '')
+
+        def borrow_return():
+            conn = pool.borrow_connection()
+            pool.return_connection(conn)
+
+        def connection_scope():
+            with pool.connection(True):
+                pass
+
+        yield bench('pool.borrow/return ' + label, borrow_return, n=max(n // threads, 100), threads=threads)
+        yield bench('pool.connection() ' + label, connection_scope, n=max(n // threads, 100), threads=threads)
+        pool.close()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+启动耗时: 在临时目录生成一个包含大量Model的包，在子进程中计时导入
+生成的包会先调用db_init(指向一个不存在的数据库)，导入过程中不应该连接数据库
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+
+from .harness import bench
+
+MODELS_PER_MODULE = 20
+
+_MODULE_HEADER = '''from libs.database.model import Model
+from libs.database.field import IntegerField, StringField, FloatField, TextField
+'''
+
+_MODEL = '''
+
+class Model%(i)d(Model):
+    id = IntegerField(primary_key=True)
+    name = StringField(index=True)
+    email = StringField(unique=True)
+    org_id = IntegerField()
+    score = FloatField()
+    remark = TextField()
+    status = IntegerField()
+    created_by = StringField()
+    __indexes__ = [('org_id', 'status')]
+'''
+
+_TIMER = '''import time
+from benchmarks import dict_shim
+start = time.perf_counter()
+import %s
+print(time.perf_counter() - start)
+'''
+
+
+def _generate(root, package, count):
+    path = os.path.join(root, package)
+    os.mkdir(path)
+    modules = []
+    for start in range(0, count, MODELS_PER_MODULE):
+        name = 'models_%d' % start
+        with open(os.path.join(path, name + '.py'), 'w') as f:
+            f.write(_MODULE_HEADER)
+            for i in range(start, min(start + MODELS_PER_MODULE, count)):
+                f.write(_MODEL % {'i': i})
+        modules.append(name)
+    with open(os.path.join(path, '__init__.py'), 'w') as f:
+        f.write("from libs.database import db_init\n"
+                "db_init(pool_name='startup', host='127.0.0.1', port=1, user='nobody')\n")
+        for name in modules:
+            f.write('from . import %s\n' % name)
+
+
+def _import_time(root, package):
+    env = dict(os.environ)
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(p for p in (root, repo, env.get('PYTHONPATH')) if p)
+    out = subprocess.check_output([sys.executable, '-c', _TIMER % package], env=env)
+    return float(out.decode().strip().splitlines()[-1])
+
+
+def run(options):
+    n = 3 if options.quick else 10
+    root = tempfile.mkdtemp(prefix='orm-startup-')
+    try:
+        for count in (100, 500):
+            package = 'startup_models_%d' % count
+            _generate(root, package, count)
+            yield bench('import %d models (subprocess)' % count, lambda: _import_time(root, package),
+                        n=n, items=count, warmup=1, alloc_samples=0, self_timed=True)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+db_core依赖的libs.classes.dict_class不在这个仓库里，没有安装时基准测试用这里的最小实现代替
+只实现db_core用到的部分: Dict(names, values)按列名构造，可以用属性访问
+"""
+
+import sys
+import types
+
+
+class Dict(dict):
+
+    def __init__(self, names=(), values=(), **kw):
+        super(Dict, self).__init__(**kw)
+        for k, v in zip(names, values):
+            self[k] = v
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(r"'Dict' object has no attribute '%s'" % key)
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+
+def install():
+    """
+    能导入真正的libs.classes.dict_class时什么也不做
+    """
+    try:
+        import libs.classes.dict_class  # noqa: F401
+        return
+    except ImportError:
+        pass
+    package = sys.modules.get('libs.classes')
+    if package is None:
+        package = types.ModuleType('libs.classes')
+        package.__path__ = []
+        sys.modules['libs.classes'] = package
+    module = types.ModuleType('libs.classes.dict_class')
+    module.Dict = Dict
+    package.dict_class = module
+    sys.modules['libs.classes.dict_class'] = module
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+不需要MySQL服务的假pymysql连接，用于基准测试
+FakeServer用内存里的列表保存表数据，只认识基准测试会用到的几种语句:
+    select @@innodb_autoinc_lock_mode / @@auto_increment_increment
+    select ... from `t` [where `c`=%s | where c in (...)]
+    insert into `t` (...) values (...),(...)
+    update / delete (只返回rowcount)
+latency 模拟每次网络往返的耗时(秒)
+"""
+
+import re
+import time
+import threading
+
+from pymysql.connections import Connection
+from pymysql.converters import encoders
+from pymysql.cursors import Cursor, DictCursorMixin
+
+from libs.database.connect_pool.connection import MySQLConnectionPool
+from libs.database.db_engine import _Engine
+
+_SELECT_RE = re.compile(r'^\s*select\s+.*?\s+from\s+`?(\w+)`?\s*(.*)$', re.I | re.S)
+_WHERE_EQ_RE = re.compile(r'where\s+`?(\w+)`?\s*=\s*(.+)$', re.I | re.S)
+_WHERE_IN_RE = re.compile(r'(?:where|and)\s+`?(\w+)`?\s+in\s*\((.*)\)', re.I | re.S)
+_INSERT_RE = re.compile(r'^\s*insert\s+into\s+`?(\w+)`?\s*\(([^)]*)\)\s*values\s*(.*)$', re.I | re.S)
+
+
+class FakeServer(object):
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = {}
+        self._auto_increment = {}
+        self._lock = threading.Lock()
+        self._thread_id = 0
+
+    def create_table(self, table, rows=()):
+        self.tables[table] = list(rows)
+        self._auto_increment[table] = len(self.tables[table]) + 1
+
+    def next_thread_id(self):
+        with self._lock:
+            self._thread_id += 1
+            return self._thread_id
+
+    def handle(self, sql):
+        """
+        :return: tuple (description, rows, rowcount, lastrowid)
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+        if sql.lstrip()[:9].lower() == 'select @@':
+            return (('lock_mode',), ('increment',)), [(1, 1)], 1, 0
+
+        m = _SELECT_RE.match(sql)
+        if m:
+            return self._select(m.group(1), m.group(2))
+
+        m = _INSERT_RE.match(sql)
+        if m:
+            return self._insert(m.group(1), m.group(2), m.group(3))
+
+        return None, [], 1, 0
+
+    def _select(self, table, where):
+        rows = self.tables.get(table, [])
+        m = _WHERE_IN_RE.search(where)
+        if m:
+            values = set(_literals(m.group(2)))
+            rows = [r for r in rows if str(r.get(m.group(1))) in values]
+        else:
+            m = _WHERE_EQ_RE.search(where)
+            if m:
+                value = _literals(m.group(2))[0]
+                rows = [r for r in rows if str(r.get(m.group(1))) == value]
+        names = tuple(rows[0].keys()) if rows else ()
+        return tuple((name,) for name in names), [tuple(r[name] for name in names) for r in rows], len(rows), 0
+
+    def _insert(self, table, cols, values):
+        cols = [c.strip(' `') for c in cols.split(',')]
+        n = values.count('),(') + 1
+        with self._lock:
+            first_id = self._auto_increment.setdefault(table, 1)
+            self._auto_increment[table] += n
+        rows = self.tables.setdefault(table, [])
+        for i in range(n):
+            row = dict((c, None) for c in cols)
+            row['id'] = first_id + i
+            rows.append(row)
+        return None, [], n, first_id
+
+
+def _literals(s):
+    return [v.strip(" '\"") for v in s.split(',')]
+
+
+class FakeCursor(Cursor):
+    """
+    借用pymysql.Cursor的参数转义，执行时交给FakeServer
+    """
+
+    def __init__(self, connection, as_dict):
+        super().__init__(connection)
+        self._as_dict = as_dict
+        self._results = []
+
+    def execute(self, query, args=None):
+        query = self.mogrify(query, args)
+        self._results = [self.connection.server.handle(q) for q in query.split(';\n')]
+        self._next_result()
+        self._executed = query
+        return self.rowcount
+
+    def executemany(self, query, args):
+        return sum(self.execute(query, arg) for arg in args)
+
+    def nextset(self):
+        if not self._results:
+            return None
+        self._next_result()
+        return True
+
+    def _next_result(self):
+        description, rows, self.rowcount, self.lastrowid = self._results.pop(0)
+        self.description = description
+        if self._as_dict and description:
+            names = [d[0] for d in description]
+            rows = [dict(zip(names, r)) for r in rows]
+        self._rows = rows
+        self.rownumber = 0
+
+    def fetchone(self):
+        if self.rownumber >= len(self._rows):
+            return None
+        self.rownumber += 1
+        return self._rows[self.rownumber - 1]
+
+    def fetchmany(self, size=None):
+        end = self.rownumber + (size or self.arraysize)
+        ret = self._rows[self.rownumber:end]
+        self.rownumber = min(end, len(self._rows))
+        return ret
+
+    def fetchall(self):
+        ret = self._rows[self.rownumber:]
+        self.rownumber = len(self._rows)
+        return ret
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+
+class FakeConnection(Connection):
+    """
+    不建立socket的pymysql连接
+    """
+
+    def __init__(self, server, cursorclass=Cursor, autocommit=False, **kwargs):
+        self.server = server
+        self.cursorclass = cursorclass
+        self.encoding = 'utf8'
+        self.charset = 'utf8'
+        self.encoders = dict(encoders)
+        self.server_status = 0
+        self.autocommit_mode = autocommit
+        self._thread_id = server.next_thread_id()
+        self._closed = False
+
+    def cursor(self, cursor=None):
+        cursor = cursor or self.cursorclass
+        return FakeCursor(self, issubclass(cursor, DictCursorMixin))
+
+    @property
+    def open(self):
+        return not self._closed
+
+    def close(self):
+        self._closed = True
+
+    def ping(self, reconnect=True):
+        self._closed = False
+
+    def autocommit(self, value):
+        self.autocommit_mode = bool(value)
+
+    def get_autocommit(self):
+        return self.autocommit_mode
+
+    def commit(self):
+        self.server.handle('commit')
+
+    def rollback(self):
+        self.server.handle('rollback')
+
+    def thread_id(self):
+        return self._thread_id
+
+
+class FakeConnectionPool(MySQLConnectionPool):
+    """
+    连接全部来自FakeServer的连接池
+    """
+
+    def __init__(self, server, pool_name='fake', **kwargs):
+        self.server = server
+        super().__init__(pool_name, **kwargs)
+
+    def _create_connection(self):
+        return FakeConnection(self.server, cursorclass=self._cursor_class, **self._other_kwargs)
+
+
+def fake_engine(server, **kwargs):
+    """
+    返回一个使用FakeConnectionPool的engine，可以直接交给DB
+    """
+    kwargs.setdefault('use_dict_cursor', False)
+    pool = FakeConnectionPool(server, **kwargs)
+    return _Engine(lambda: pool)
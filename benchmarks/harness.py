@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+基准测试的计时和统计
+每个用例先预热，然后按线程数并发执行，记录每次调用的耗时；
+最后单线程再跑一遍统计内存分配: 调用的返回值在统计期间不释放，
+所以allocs/bytes是每次调用留下的对象块数和字节数(比如物化出来的Model)
+"""
+
+import json
+import time
+import threading
+import tracemalloc
+from collections import namedtuple
+
+Result = namedtuple('Result', ['name', 'ops', 'seconds', 'ops_per_sec', 'p50_us', 'p95_us', 'p99_us',
+                               'allocs_per_op', 'bytes_per_op'])
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def bench(name, func, n=1000, threads=1, items=1, warmup=None, alloc_samples=None, self_timed=False):
+    """
+    :param name: str 用例名
+    :param func: 无参函数，执行一次操作
+    :param n: int 每个线程执行多少次
+    :param threads: int 并发线程数
+    :param items: int 每次调用处理多少条数据，ops按条数计算(比如一次查询物化1000行)
+    :param warmup: int 预热次数，默认n/10
+    :param alloc_samples: int 统计内存分配时执行多少次，默认min(n, 100)
+    :param self_timed: boolean func自己返回耗时(秒)，比如在子进程里计时
+    :return: Result instance
+    """
+    for _ in range(n // 10 if warmup is None else warmup):
+        func()
+
+    latencies = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def _run(out):
+        barrier.wait()
+        timer = time.perf_counter
+        for _ in range(n):
+            start = timer()
+            ret = func()
+            out.append(ret if self_timed else timer() - start)
+
+    workers = [threading.Thread(target=_run, args=(latencies[i],)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for w in workers:
+        w.join()
+    seconds = time.perf_counter() - start
+    if self_timed:
+        seconds = sum(sum(l) for l in latencies) / threads
+
+    allocs, size = _allocations(func, min(n, 100) if alloc_samples is None else alloc_samples)
+
+    samples = sorted(t for l in latencies for t in l)
+    ops = n * threads * items
+    return Result(name, ops, seconds, ops / seconds if seconds else 0.0,
+                  percentile(samples, 50) * 1e6 / items,
+                  percentile(samples, 95) * 1e6 / items,
+                  percentile(samples, 99) * 1e6 / items,
+                  allocs / float(items), size / float(items))
+
+
+def _allocations(func, samples):
+    if not samples:
+        return 0.0, 0.0
+    keep = []
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        for _ in range(samples):
+            keep.append(func())
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    blocks = sum(s.count_diff for s in stats if s.count_diff > 0)
+    size = sum(s.size_diff for s in stats if s.size_diff > 0)
+    return blocks / float(samples), size / float(samples)
+
+
+def report(results, baseline=None):
+    """
+    以表格形式输出结果，传入baseline时输出ops/sec相对基线的比例
+    """
+    baseline = dict((r['name'], r) for r in baseline or [])
+    header = '%-42s %12s %10s %10s %10s %10s %10s' % ('benchmark', 'ops/sec', 'p50(us)', 'p95(us)', 'p99(us)',
+                                                     'allocs/op', 'vs base')
+    lines = [header, '-' * len(header)]
+    for r in results:
+        base = baseline.get(r.name)
+        ratio = '%.2fx' % (r.ops_per_sec / base['ops_per_sec']) if base and base['ops_per_sec'] else ''
+        lines.append('%-42s %12.1f %10.2f %10.2f %10.2f %10.1f %10s' % (
+            r.name, r.ops_per_sec, r.p50_us, r.p95_us, r.p99_us, r.allocs_per_op, ratio))
+    return '\n'.join(lines)
+
+
+def dump(results, path):
+    with open(path, 'w') as f:
+        json.dump([r._asdict() for r in results], f, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+基准测试入口，在仓库根目录执行:
+    python -m benchmarks.run                         # 全部用例
+    python -m benchmarks.run --quick -k pool         # 只跑名字里带pool的模块，减少次数
+    python -m benchmarks.run --json base.json        # 保存结果
+    python -m benchmarks.run --baseline base.json    # 和保存的结果对比
+    python -m benchmarks.run --latency-ms 0.2        # 模拟每次网络往返0.2ms
+默认使用fake_mysql中的假连接，测的是客户端自身的开销
+"""
+
+import argparse
+import importlib
+import sys
+
+from . import harness
+
+MODULES = ['bench_pool', 'bench_orm', 'bench_startup', 'bench_drivers']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='python-orm benchmarks')
+    parser.add_argument('-k', dest='filter', default='', help='only run modules whose name contains this')
+    parser.add_argument('--quick', action='store_true', help='fewer iterations')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='simulated round-trip latency')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='compare with results saved by --json')
+    options = parser.parse_args(argv)
+    options.latency = options.latency_ms / 1000.0
+
+    results = []
+    for name in MODULES:
+        if options.filter not in name:
+            continue
+        module = importlib.import_module('.' + name, __package__)
+        for result in module.run(options):
+            results.append(result)
+            print('%-42s %12.1f ops/sec' % (result.name, result.ops_per_sec), file=sys.stderr)
+
+    print(harness.report(results, harness.load(options.baseline) if options.baseline else None))
+    if options.json:
+        harness.dump(results, options.json)
+
+
+if __name__ == '__main__':
+    main()
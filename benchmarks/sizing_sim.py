@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+连接池大小策略的离线模拟，不需要数据库也不启动线程，用模拟时钟驱动SizingController:
+    python -m benchmarks.sizing_sim                          # 默认场景下对比全部策略
+    python -m benchmarks.sizing_sim --policy aimd --timeline # 输出每个周期的连接数变化
+    python -m benchmarks.sizing_sim --scenario slow_db
+请求按泊松过程到达，持有时间服从指数分布；没有空闲连接且没到上限时新建连接(耗时connect_ms)，
+否则排队等待，连接池缩小时空闲连接立即关闭，借出的多余连接归还时关闭
+"""
+
+import argparse
+import heapq
+import random
+from collections import deque
+
+from libs.database.connect_pool.sizing import SizingController, ScalePolicy, AIMDPolicy, LittlePolicy
+
+"""
+场景: [(持续秒数, 每秒请求数, 平均持有毫秒数), ...]
+"""
+SCENARIOS = {
+    'spike': [(20, 200, 10), (10, 2000, 10), (20, 200, 10), (20, 10, 10)],
+    'slow_db': [(20, 300, 5), (20, 300, 40), (20, 300, 5)],
+    'ramp': [(10, rate, 10) for rate in (50, 100, 200, 400, 800, 1600, 800, 400, 200, 50)],
+}
+
+POLICIES = {
+    'scale': lambda: ScalePolicy(1.5),
+    'aimd': lambda: AIMDPolicy(),
+    'little': lambda: LittlePolicy(),
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def simulate(phases, policy, initial=5, min_size=1, max_size=48, interval=1.0, connect_ms=5.0, seed=1):
+    """
+    :return: dict，包括等待时间分位数、平均/最大连接数、新建和关闭的连接数，timeline为每个周期的(时间, 连接数, 最大连接数, 借出数)
+    """
+    rnd = random.Random(seed)
+    controller = SizingController(policy, min_size, max_size, interval)
+    events = []
+    seq = 0
+
+    def push(at, kind, data=None):
+        nonlocal seq
+        seq += 1
+        heapq.heappush(events, (at, seq, kind, data))
+
+    t = 0.0
+    for duration, rate, hold_ms in phases:
+        end = t + duration
+        while True:
+            t += rnd.expovariate(rate)
+            if t >= end:
+                break
+            push(t, 'arrive', rnd.expovariate(1000.0 / hold_ms))
+        t = end
+    total = t
+    controller.due(0.0)
+    for i in range(1, int(total / interval) + 1):
+        push(i * interval, 'tick')
+
+    state = {'target': initial, 'open': 0, 'idle': 0, 'in_use': 0, 'connecting': 0,
+             'opened': 0, 'closed': 0}
+    queue = deque()
+    waits = []
+    timeline = []
+    area = 0.0
+    last = 0.0
+    peak = 0
+
+    def start(now, arrived, hold):
+        waits.append(now - arrived)
+        state['in_use'] += 1
+        controller.observe_borrow(now - arrived, state['in_use'])
+        push(now + hold, 'release', hold)
+
+    def dispatch(now):
+        while queue and state['idle']:
+            state['idle'] -= 1
+            start(now, *queue.popleft())
+        while queue and state['open'] + state['connecting'] < state['target'] and \
+                len(queue) > state['connecting']:
+            state['connecting'] += 1
+            state['opened'] += 1
+            push(now + connect_ms / 1000.0, 'connected')
+
+    while events:
+        now, _, kind, data = heapq.heappop(events)
+        area += state['open'] * (now - last)
+        last = now
+
+        if kind == 'arrive':
+            controller.observe_request()
+            queue.append((now, data))
+            dispatch(now)
+        elif kind == 'connected':
+            state['connecting'] -= 1
+            state['open'] += 1
+            state['idle'] += 1
+            dispatch(now)
+        elif kind == 'release':
+            state['in_use'] -= 1
+            controller.observe_release(data)
+            if state['open'] > state['target']:
+                state['open'] -= 1
+                state['closed'] += 1
+            else:
+                state['idle'] += 1
+            dispatch(now)
+        elif kind == 'tick':
+            target = controller.tick(state['open'], state['target'], now)
+            if target is not None:
+                state['target'] = target
+            surplus = min(state['idle'], state['open'] - state['target'])
+            if surplus > 0:
+                state['open'] -= surplus
+                state['idle'] -= surplus
+                state['closed'] += surplus
+            dispatch(now)
+            timeline.append((now, state['open'], state['target'], state['in_use']))
+        peak = max(peak, state['open'])
+
+    return {
+        'requests': len(waits),
+        'wait_p50_ms': percentile(waits, 50) * 1000,
+        'wait_p99_ms': percentile(waits, 99) * 1000,
+        'wait_max_ms': max(waits) * 1000 if waits else 0.0,
+        'avg_conns': area / last if last else 0.0,
+        'peak_conns': peak,
+        'opened': state['opened'],
+        'closed': state['closed'],
+        'timeline': timeline,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='offline simulation of pool sizing policies')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='spike')
+    parser.add_argument('--policy', choices=sorted(POLICIES) + ['all'], default='all')
+    parser.add_argument('--initial', type=int, default=5, help='initial max pool size')
+    parser.add_argument('--boundary', type=int, default=48, help='pool_resize_boundary')
+    parser.add_argument('--interval', type=float, default=1.0, help='sizing interval in seconds')
+    parser.add_argument('--connect-ms', type=float, default=5.0, help='time to open a connection')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeline', action='store_true', help='print pool size per interval')
+    options = parser.parse_args(argv)
+
+    names = sorted(POLICIES) if options.policy == 'all' else [options.policy]
+    print('%-8s %9s %10s %10s %10s %9s %6s %7s %7s' % ('policy', 'requests', 'p50 ms', 'p99 ms', 'max ms',
+                                                      'avg conn', 'peak', 'opened', 'closed'))
+    for name in names:
+        result = simulate(SCENARIOS[options.scenario], POLICIES[name](), initial=options.initial,
+                          max_size=options.boundary, interval=options.interval,
+                          connect_ms=options.connect_ms, seed=options.seed)
+        print('%-8s %9d %10.2f %10.2f %10.2f %9.1f %6d %7d %7d' % (
+            name, result['requests'], result['wait_p50_ms'], result['wait_p99_ms'], result['wait_max_ms'],
+            result['avg_conns'], result['peak_conns'], result['opened'], result['closed']))
+        if options.timeline:
+            for now, size, target, in_use in result['timeline']:
+                print('    t=%6.1f size=%3d target=%3d in_use=%3d' % (now, size, target, in_use))
+
+
+if __name__ == '__main__':
+    main()
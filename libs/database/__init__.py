@@ -7,20 +7,51 @@ from .db_engine import create_engine
 from .db_core import DBBase
 from .database import DB
 
+DEFAULT_DATABASE = 'default'
+
 db = None
 
+_databases = {}
+
 
 def db_init(**kw):
+    """
+    初始化默认数据库，等同于 register_database(DEFAULT_DATABASE, **kw)
+    """
+    return register_database(DEFAULT_DATABASE, **kw)
+
+
+def register_database(name, **kw):
+    """
+    注册一个命名的数据库，同一个进程可以同时使用多个数据库/连接池
+    Model通过 __database__ = name 绑定到指定的数据库，没有指定时使用db_init初始化的默认数据库
+    :param name: str
+    :param kw: create_engine的参数，没有指定pool_name时使用name做连接池名
+    :return: DB instance
+    """
     global db
 
-    if db is None:
-        engine = create_engine(**kw)
-        db = DB(engine)
-
-    return db
-
-
-
-
-
-
+    if name not in _databases:
+        kw.setdefault('pool_name', name)
+        _databases[name] = DB(create_engine(**kw))
+    if name == DEFAULT_DATABASE:
+        db = _databases[name]
+    return _databases[name]
+
+
+def get_database(name=None):
+    """
+    按名字取出注册过的数据库，name为空时返回默认数据库
+    :param name: str
+    :return: DB instance
+    """
+    if name is None or name == DEFAULT_DATABASE:
+        # 没有注册默认数据库时，兼容直接给模块变量db赋值的用法
+        default = _databases.get(DEFAULT_DATABASE, db)
+        if default is None:
+            raise RuntimeError('Default database not initialized, call db_init first')
+        return default
+    try:
+        return _databases[name]
+    except KeyError:
+        raise KeyError('Database not registered: %s' % name)
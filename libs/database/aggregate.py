@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+在数据库端完成的分组聚合，见Model.aggregate
+    Order.aggregate(group_by=['user_id'], sum=['amount'], count=True,
+                    where='where `status`=?', args=[1],
+                    having='`sum_amount` > ?', having_args=[100],
+                    order_by=['-sum_amount'], limit=10)
+    => [OrderAggregate(user_id=3, sum_amount=Decimal('420.00'), count=7), ...]
+
+    SQL: select `user_id`,sum(`amount`) as `sum_amount`,count(*) as `count` from `order` where `status`=?
+         group by `user_id` having `sum_amount` > ? order by `sum_amount` desc limit 10
+
+字段名使用Model的属性名，不在__mappings__中时抛出ValueError
+聚合结果的列名为 函数名_属性名(sum_amount, avg_score ...)，count=True时为count
+order_by可以是分组字段或聚合列名，前面加'-'表示降序；where和having是SQL片段，参数通过args和having_args传入
+columnar=True时返回 {列名: [值, ...]}，否则返回namedtuple列表
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+
+from .schema import record_lookup, where_columns
+
+FUNCTIONS = ('sum', 'avg', 'min', 'max', 'count')
+
+
+@lru_cache(maxsize=256)
+def _row_class(name, columns):
+    return namedtuple(name, columns)
+
+
+def field_list(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+def _column(model, field):
+    try:
+        return model.__mappings__[field].name
+    except KeyError:
+        raise ValueError('{} has no field {!r}'.format(model.__name__, field))
+
+
+def aggregate_sql(model, group_by=(), functions=(), where='', having='', order_by=(), limit=None):
+    """
+    :param functions: [(函数名, 属性名或True), ...]，True只用于count，表示count(*)
+    :return: (sql, 列名列表)
+    """
+    selects = []
+    columns = []
+    for field in field_list(group_by):
+        column = _column(model, field)
+        selects.append('`%s`' % column if column == field else '`%s` as `%s`' % (column, field))
+        columns.append(field)
+
+    for func, field in functions:
+        if func not in FUNCTIONS:
+            raise ValueError('Unsupported aggregate function {!r}'.format(func))
+        if field is True:
+            if func != 'count':
+                raise ValueError('{}() needs a field'.format(func))
+            alias = 'count'
+            selects.append('count(*) as `count`')
+        else:
+            alias = '%s_%s' % (func, field)
+            selects.append('%s(`%s`) as `%s`' % (func, _column(model, field), alias))
+        columns.append(alias)
+
+    if not selects:
+        raise ValueError('Nothing to aggregate')
+    if len(set(columns)) != len(columns):
+        raise ValueError('Duplicate aggregate columns {}'.format(columns))
+
+    sql = ['select %s from `%s`' % (','.join(selects), model.__table__)]
+    if where:
+        sql.append(where)
+    if group_by:
+        sql.append('group by %s' % ','.join(['`%s`' % _column(model, f) for f in field_list(group_by)]))
+    if having:
+        sql.append('having %s' % having)
+
+    orders = []
+    for name in field_list(order_by):
+        desc = name.startswith('-')
+        name = name.lstrip('-')
+        if name not in columns:
+            raise ValueError('Cannot order by {!r}, expected one of {}'.format(name, columns))
+        orders.append('`%s`%s' % (name, ' desc' if desc else ''))
+    if orders:
+        sql.append('order by %s' % ','.join(orders))
+    if limit is not None:
+        sql.append('limit %d' % int(limit))
+    return ' '.join(sql), columns
+
+
+def aggregate(model, group_by=(), functions=(), where='', args=(), having='', having_args=(),
+              order_by=(), limit=None, columnar=False, timeout=None):
+    sql, columns = aggregate_sql(model, group_by, functions, where, having, order_by, limit)
+    record_lookup(model.__table__, *where_columns(where))
+    rows = model._get_db().select(sql, *(list(args) + list(having_args)), timeout=timeout)
+
+    if columnar:
+        return dict((c, [row[c] for row in rows]) for c in columns)
+    row_class = _row_class('%sAggregate' % model.__name__, tuple(columns))
+    return [row_class(*[row[c] for c in columns]) for row in rows]
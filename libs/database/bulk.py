@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+批量导入导出
+
+Model.load_from: 按__mappings__中的字段类型把数据序列化成TSV，用 LOAD DATA LOCAL INFILE 导入
+    数据由后台线程写进管道，服务端通过 /dev/fd/N 读取，不需要生成临时文件；
+    没有/dev/fd的系统上退回到临时文件。需要在create_engine时打开 local_infile=True
+        User.load_from(rows, progress=lambda n: logging.info('%s rows sent', n))
+
+Model.export_to: 用服务端游标(SSCursor)逐行读取，写成CSV或TSV，内存占用不随行数增长
+        with open('user.csv', 'w', newline='') as f:
+            User.export_to(f, 'where `org_id`=?', [1])
+    TSV格式和load_from一致(需要以二进制模式打开文件)，可以直接导回
+"""
+
+import os
+import re
+import csv
+import tempfile
+import threading
+
+from .field import BooleanField, IntegerField, FloatField, BlobField
+from .lob import check_inline
+
+PROGRESS_EVERY = 10000
+
+_NULL = b'\\N'
+_ESCAPE_RE = re.compile(b'[\\\\\t\n\r\x00]')
+_ESCAPES = {b'\\': b'\\\\', b'\t': b'\\t', b'\n': b'\\n', b'\r': b'\\r', b'\x00': b'\\0'}
+
+_LOAD_SQL = ("load data local infile '%s' into table `%s` character set utf8mb4 "
+             "fields terminated by '\\t' escaped by '\\\\' lines terminated by '\\n' (%s)")
+
+
+def _escape(value):
+    return _ESCAPE_RE.sub(lambda m: _ESCAPES[m.group(0)], value)
+
+
+def _serializer(field):
+    """
+    按字段类型返回 值 => TSV字节 的转换函数
+    """
+    if isinstance(field, BooleanField):
+        return lambda v: b'1' if v else b'0'
+    if isinstance(field, IntegerField):
+        return lambda v: str(int(v)).encode()
+    if isinstance(field, FloatField):
+        return lambda v: repr(float(v)).encode()
+    if isinstance(field, BlobField):
+        convert = lambda v: _escape(bytes(v) if isinstance(v, (bytes, bytearray, memoryview)) else str(v).encode('utf-8'))
+    else:
+        convert = lambda v: _escape(str(v).encode('utf-8'))
+    if field.deferred:
+        return lambda v: convert(check_inline(field, v))
+    return convert
+
+
+def _load_fields(model, fields):
+    if fields:
+        mappings = dict((v.name, (k, v)) for k, v in model.__mappings__.items())
+        mappings.update((k, (k, v)) for k, v in model.__mappings__.items())
+        return [mappings[f] for f in fields]
+    return [(k, v) for k, v in sorted(model.__mappings__.items(), key=lambda x: x[1]._order)
+            if v.insertable and not v.deferred]
+
+
+def iter_tsv(model, rows, fields=None):
+    """
+    把行(dict/Model实例，或者按fields顺序排列的tuple/list)转换成TSV格式的行
+    dict中没有的字段使用字段的默认值，主键没有值时写NULL，由数据库生成自增主键
+    """
+    fields = _load_fields(model, fields)
+    pk = model.__primary_key__.name
+    converters = [(k, v, _serializer(v)) for k, v in fields]
+
+    for row in rows:
+        values = []
+        if isinstance(row, dict):
+            for k, v, convert in converters:
+                # Model.get是按主键查询的类方法，这里用dict.get
+                value = dict.get(row, k, dict.get(row, v.name, _NULL if v.name == pk else v.default))
+                values.append(_NULL if value is None or value is _NULL else convert(value))
+        else:
+            for (k, v, convert), value in zip(converters, row):
+                values.append(_NULL if value is None else convert(value))
+        yield b'\t'.join(values) + b'\n'
+
+
+def load_from(model, source, fields=None, progress=None, progress_every=PROGRESS_EVERY):
+    """
+    :param model: Model的子类
+    :param source: 行的可迭代对象，或者已经是TSV格式(按fields顺序)的二进制文件对象
+    :param fields: 导入的字段，默认是所有可插入、非延迟读取的字段
+    :param progress: 进度回调，参数是已发送的行数(文件对象按块计数)，在写数据的线程里调用
+    :param progress_every: 每多少行回调一次
+    :return: int 导入的行数
+    """
+    columns = ','.join(['`%s`' % v.name for k, v in _load_fields(model, fields)])
+    chunks = _iter_file(source) if hasattr(source, 'read') else iter_tsv(model, source, fields)
+
+    db_base = model._get_db().db_base
+    with db_base.connection.connection(False) as conn:
+        cursor = conn.cursor()
+        try:
+            if os.path.isdir('/dev/fd'):
+                rowcount = _load_from_pipe(cursor, model.__table__, columns, chunks, progress, progress_every)
+            else:
+                rowcount = _load_from_tempfile(cursor, model.__table__, columns, chunks, progress, progress_every)
+            conn.commit()
+            return rowcount
+        except Exception as err:
+            conn.rollback()
+            raise err
+        finally:
+            cursor.close()
+
+
+def _load_from_pipe(cursor, table, columns, chunks, progress, progress_every):
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def _write():
+        try:
+            with os.fdopen(write_fd, 'wb') as f:
+                _write_chunks(f, chunks, progress, progress_every)
+        except BrokenPipeError:
+            pass
+        except Exception as err:
+            errors.append(err)
+
+    writer = threading.Thread(target=_write, name='load-data-writer', daemon=True)
+    writer.start()
+    try:
+        cursor.execute(_LOAD_SQL % ('/dev/fd/%d' % read_fd, table, columns))
+    finally:
+        # 服务端提前结束读取时，关闭读端让写线程退出
+        os.close(read_fd)
+        writer.join()
+    if errors:
+        raise errors[0]
+    return cursor.rowcount
+
+
+def _load_from_tempfile(cursor, table, columns, chunks, progress, progress_every):
+    with tempfile.NamedTemporaryFile(suffix='.tsv') as f:
+        _write_chunks(f, chunks, progress, progress_every)
+        f.flush()
+        cursor.execute(_LOAD_SQL % (f.name.replace('\\', '/'), table, columns))
+    return cursor.rowcount
+
+
+def _write_chunks(f, chunks, progress, progress_every):
+    n = 0
+    for chunk in chunks:
+        f.write(chunk)
+        n += 1
+        if progress and n % progress_every == 0:
+            progress(n)
+    if progress:
+        progress(n)
+
+
+def _iter_file(f, chunk_size=1024 * 1024):
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk if isinstance(chunk, bytes) else chunk.encode('utf-8')
+
+
+def export_to(model, f, where='', args=(), fields=None, fmt='csv', header=True):
+    """
+    :param model: Model的子类
+    :param f: csv格式写入文本文件，tsv格式写入二进制文件
+    :param where: str
+    :param args: list
+    :param fields: 导出的字段，默认是所有非延迟读取的字段
+    :param fmt: 'csv' 或 'tsv'
+    :param header: csv格式时是否写表头
+    :return: int 导出的行数
+    """
+    if fmt not in ('csv', 'tsv'):
+        raise ValueError('Unknown export format: %s' % fmt)
+
+    fields = _load_fields(model, fields) if fields else [
+        (k, v) for k, v in sorted(model.__mappings__.items(), key=lambda x: x[1]._order) if not v.deferred]
+    sql = 'select %s from `%s` %s' % (','.join(['`%s`' % v.name for k, v in fields]), model.__table__, where)
+
+    pool = model._get_db().db_base.connection
+    n = 0
+    with pool.cursor(pool.driver.ss_cursor_class) as cursor:
+        cursor.execute(sql.replace('?', '%s'), args)
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            if header:
+                writer.writerow([v.name for k, v in fields])
+            for row in cursor:
+                writer.writerow(row)
+                n += 1
+        else:
+            converters = [_serializer(v) for k, v in fields]
+            for row in cursor:
+                f.write(b'\t'.join([_NULL if value is None else convert(value)
+                                    for convert, value in zip(converters, row)]) + b'\n')
+                n += 1
+    return n
@@ -0,0 +1,93 @@
+import random
+import logging
+import threading
+from time import monotonic
+
+logger = logging.getLogger('pymysqlpool')
+
+__all__ = ['CircuitBreaker']
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker(object):
+    """
+    新建连接的熔断器
+        closed: 正常新建连接，连续失败failure_threshold次后打开
+        open: 拒绝新建连接，等待时间按指数退避(base_delay * 2^n，不超过max_delay)并加上随机抖动
+        half_open: 等待时间过后只放行一个探测，成功则关闭，失败则重新打开并加长等待时间
+    """
+
+    def __init__(self, failure_threshold=3, base_delay=0.1, max_delay=30.0, jitter=0.5):
+        if failure_threshold < 1:
+            raise ValueError('Invalid failure threshold {}, must be at least 1'.format(failure_threshold))
+        self._failure_threshold = failure_threshold
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._jitter = jitter
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._retry_at = 0.0
+        self._probing = False
+
+    def __repr__(self):
+        return '<CircuitBreaker state={}, failures={}>'.format(self.state, self._failures)
+
+    @property
+    def state(self):
+        if self._state == OPEN and monotonic() >= self._retry_at:
+            return HALF_OPEN
+        return self._state
+
+    def is_open(self):
+        """
+        是否处于拒绝状态，不需要加锁，用于等待者快速失败
+        """
+        return self._state == OPEN and monotonic() < self._retry_at
+
+    def allow(self):
+        """
+        是否允许新建连接，半开状态下同一时间只放行一个探测
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if monotonic() < self._retry_at:
+                    return False
+                self._state = HALF_OPEN
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info('Circuit breaker closed after %s failures', self._failures)
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self._failure_threshold:
+                exponent = min(self._failures - self._failure_threshold, 32)
+                delay = min(self._max_delay, self._base_delay * 2 ** max(exponent, 0))
+                delay *= 1 - self._jitter * random.random()
+                self._state = OPEN
+                self._retry_at = monotonic() + delay
+                self._probing = False
+                logger.warning('Circuit breaker opened after %s failures, retry in %.3fs', self._failures, delay)
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'failures': self._failures,
+            'retry_in': max(0.0, self._retry_at - monotonic()) if self._state == OPEN else 0.0,
+        }
@@ -1,17 +1,33 @@
+import os
+import math
 import logging
 import threading
 import contextlib
-
-from pymysql.connections import Connection
-from pymysql.cursors import DictCursor, Cursor
+from time import monotonic
 
 from .pool import PoolContainer, PoolIsFullException, PoolIsEmptyException
+from .breaker import CircuitBreaker
+from .drivers import get_driver
+from .sizing import SizingController
 
 logger = logging.getLogger('pymysqlpool')
 
 __all__ = ['MySQLConnectionPool']
 
 
+_fork_lock = threading.Lock()
+
+
+def _reinit_fork_lock():
+    global _fork_lock
+    _fork_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    # fork时锁可能正被父进程的其他线程持有，子进程里换一把新锁
+    os.register_at_fork(after_in_child=_reinit_fork_lock)
+
+
 class NoFreeConnectionFoundError(Exception):
     pass
 
@@ -20,13 +36,20 @@ class PoolBoundaryExceedsError(Exception):
     pass
 
 
+class CircuitBreakerOpenError(NoFreeConnectionFoundError):
+    pass
+
+
 class MySQLConnectionPool(object):
 
     def __init__(self, pool_name, host=None, user=None, password="", database=None, port=3306,
                  charset='utf8', use_dict_cursor=True, max_pool_size=30,
                  enable_auto_resize=True, auto_resize_scale=1.5,
                  pool_resize_boundary=48,
-                 defer_connect_pool=False, **kwargs):
+                 defer_connect_pool=False, multi_statements=False,
+                 sticky_connections=False, circuit_breaker=None, borrow_wait_slice=0.5,
+                 sizing_policy=None, sizing_interval=1.0, min_pool_size=1, driver=None, batch_pool_size=4,
+                 **kwargs):
 
         """
         初始化连接池.
@@ -42,7 +65,20 @@ class MySQLConnectionPool(object):
         :param enable_auto_resize: 是否允许动态更改最大连接数
         :param pool_resize_boundary: 设置数据库允许的最大连接
         :param auto_resize_scale: 连接池动态更改最大比例
-        :param kwargs: 其他`pymysql.Connection`配置项
+        :param multi_statements: 批量执行(DB.batch/execute_batch)是否把多条语句拼接后一次发送，节省网络往返；
+                                 只有批量执行专用的连接池(最多batch_pool_size个连接)带CLIENT.MULTI_STATEMENTS，
+                                 普通查询的连接不开启，拼接SQL的注入漏洞不能借此执行堆叠语句
+        :param sticky_connections: 线程归还的连接优先留给该线程下次借用(见PoolContainer)
+        :param circuit_breaker: 新建连接的熔断器(`CircuitBreaker`实例)，默认连续失败3次后打开
+        :param borrow_wait_slice: 连接池满时每次阻塞等待的时长，每次等待结束后重新检查熔断状态和连接池大小
+        :param sizing_policy: 连接池大小策略(`SizingPolicy`实例，如AIMDPolicy/LittlePolicy)，
+                              设置后每sizing_interval秒根据借用等待、并发和持有时间在[min_pool_size, pool_resize_boundary]内
+                              调整最大连接数，可以扩大也可以缩小，不再使用auto_resize_scale
+        :param sizing_interval: 策略的采样周期(秒)
+        :param min_pool_size: 策略调整时的最小连接数
+        :param driver: 数据库驱动，'pymysql'(默认)、'mysqldb'/'mysqlclient'或者Driver实例(见drivers.py)
+        :param batch_pool_size: multi_statements时批量执行专用连接池的最大连接数
+        :param kwargs: 其他驱动连接配置项
         """
         # 数据库连接配置
         self._host = host
@@ -51,7 +87,12 @@ class MySQLConnectionPool(object):
         self._database = database
         self._port = port
         self._charset = charset
-        self._cursor_class = DictCursor if use_dict_cursor else Cursor
+        self._driver = get_driver(driver)
+        self._use_dict_cursor = use_dict_cursor
+        self._cursor_class = self._driver.cursor_class(use_dict_cursor)
+        self._multi_statements = multi_statements
+        self._batch_pool_size = batch_pool_size
+        self._batch_pool = None
         self._other_kwargs = kwargs
 
         # 数据库连接池配置
@@ -63,8 +104,17 @@ class MySQLConnectionPool(object):
             raise ValueError(
                 "Invalid scale {}, must be bigger than 1".format(auto_resize_scale))
 
-        self._auto_resize_scale = int(round(auto_resize_scale, 0))
-        self._pool_container = PoolContainer(self._max_pool_size)
+        self._auto_resize_scale = auto_resize_scale
+        self._sticky_connections = sticky_connections
+        self._pool_container = PoolContainer(self._max_pool_size, sticky_connections)
+        self._pid = os.getpid()
+        self._breaker = circuit_breaker or CircuitBreaker()
+        self._borrow_wait_slice = borrow_wait_slice
+        self._create_lock = threading.Lock()
+        self._sizing = None
+        self._borrowed_at = {}
+        if sizing_policy is not None:
+            self._sizing = SizingController(sizing_policy, min_pool_size, pool_resize_boundary, sizing_interval)
 
         self.__safe_lock = threading.RLock()
         self.__is_killed = False
@@ -95,6 +145,14 @@ class MySQLConnectionPool(object):
     def free_size(self):
         return self._pool_container.free_size
 
+    @property
+    def driver(self):
+        return self._driver
+
+    @property
+    def multi_statements(self):
+        return self._multi_statements
+
     @property
     def size(self):
         return '<boundary={}, max={}, current={}, free={}>'.format(self._pool_resize_boundary,
@@ -102,10 +160,31 @@ class MySQLConnectionPool(object):
                                                                    self.pool_size,
                                                                    self.free_size)
 
+    @property
+    def breaker(self):
+        return self._breaker
+
+    @property
+    def pool_resize_boundary(self):
+        return self._pool_resize_boundary
+
+    def stats(self):
+        """
+        连接池状态，包括熔断器状态
+        """
+        return {
+            'name': self._pool_name,
+            'boundary': self._pool_resize_boundary,
+            'max': self._max_pool_size,
+            'current': self.pool_size,
+            'free': self.free_size,
+            'breaker': self._breaker.stats(),
+            'sizing': self._sizing.stats() if self._sizing is not None else None,
+        }
+
     @contextlib.contextmanager
     def cursor(self, cursor=None):
         with self.connection(True) as conn:
-            assert isinstance(conn, Connection)
             cursor = conn.cursor(cursor)
 
             try:
@@ -119,7 +198,6 @@ class MySQLConnectionPool(object):
     @contextlib.contextmanager
     def connection(self, autocommit=False):
         conn = self.borrow_connection()
-        assert isinstance(conn, Connection)
         old_value = conn.get_autocommit()
         conn.autocommit(autocommit)
         try:
@@ -131,6 +209,38 @@ class MySQLConnectionPool(object):
             conn.autocommit(old_value)
             self.return_connection(conn)
 
+    @contextlib.contextmanager
+    def batch_connection(self, autocommit=False):
+        """
+        批量执行使用的连接，multi_statements时来自专用的连接池，否则和connection()相同
+        """
+        pool = self._get_batch_pool() if self._multi_statements else self
+        with pool.connection(autocommit) as conn:
+            yield conn
+
+    def _get_batch_pool(self):
+        """
+        第一次批量执行时创建，连接带CLIENT.MULTI_STATEMENTS，和本连接池共用熔断器
+        """
+        if self._batch_pool is None:
+            with self.__safe_lock:
+                if self._batch_pool is None:
+                    kwargs = dict(self._other_kwargs)
+                    kwargs['client_flag'] = kwargs.get('client_flag', 0) | self._driver.multi_statements_flag
+                    self._batch_pool = MySQLConnectionPool('%s-batch' % self._pool_name, host=self._host,
+                                                           user=self._user, password=self._password,
+                                                           database=self._database, port=self._port,
+                                                           charset=self._charset,
+                                                           use_dict_cursor=self._use_dict_cursor,
+                                                           max_pool_size=self._batch_pool_size,
+                                                           enable_auto_resize=False,
+                                                           pool_resize_boundary=self._batch_pool_size,
+                                                           defer_connect_pool=True,
+                                                           circuit_breaker=self._breaker,
+                                                           borrow_wait_slice=self._borrow_wait_slice,
+                                                           driver=self._driver, **kwargs)
+        return self._batch_pool
+
     def connect(self):
         """
         启动连接池
@@ -166,7 +276,11 @@ class MySQLConnectionPool(object):
             if self.__is_killed is True:
                 return True
 
-        self._free()
+        # 子进程里的连接是从父进程继承来的，关闭会给父进程的连接发送COM_QUIT
+        if self._pid == os.getpid():
+            self._free()
+        if self._batch_pool is not None:
+            self._batch_pool.close()
 
         with self.__safe_lock:
             self.__is_killed = True
@@ -174,66 +288,181 @@ class MySQLConnectionPool(object):
     def borrow_connection(self):
         """
         从连接池中获取一个连接
+        没有空闲连接时先尝试新建连接，连接池满了或其他线程正在新建连接时分段阻塞等待
+        熔断器打开期间拿不到空闲连接直接抛出`CircuitBreakerOpenError`
         """
-        block = True
+        self._check_fork()
+        sizing = self._sizing
+        started = None
+        if sizing is not None:
+            started = monotonic()
+            sizing.observe_request()
+        block = False
 
         while True:
             conn = self._borrow(block)
             if conn is None:
                 block = not self._adjust_connection_pool()
             else:
+                if sizing is not None:
+                    now = monotonic()
+                    self._borrowed_at[conn] = now
+                    sizing.observe_borrow(now - started, self.pool_size - self.free_size)
+                    self._apply_sizing(now)
                 return conn
 
     def _borrow(self, block):
         try:
-            connection = self._pool_container.get(block, None)
+            connection = self._pool_container.get(block, self._borrow_wait_slice)
         except PoolIsEmptyException:
             return None
         else:
-            # 检查连接是否还存活
-            connection.ping(reconnect=True)
-            return connection
+            # 检查连接是否还存活，断开的连接移出容器并关闭，空出的位置由调用方通过_adjust_connection_pool补上
+            if self._driver.ping(connection):
+                return connection
+            if self._pool_container.remove(connection):
+                self._close_connection(connection)
+            return None
 
     def return_connection(self, connection):
         """
         将使用完连接放回连接池
         """
+        if self._pid != os.getpid():
+            # fork之前借出的连接，子进程里直接丢弃
+            return False
+
+        if self._sizing is not None:
+            now = monotonic()
+            borrowed_at = self._borrowed_at.pop(connection, None)
+            if borrowed_at is not None:
+                self._sizing.observe_release(now - borrowed_at)
+            self._apply_sizing(now)
+
+            # 只有大小策略会缩小连接池，多出来的连接在归还时关闭
+            if self.pool_size > self._max_pool_size and self._pool_container.remove(connection):
+                self._close_connection(connection)
+                return True
         return self._pool_container.return_(connection)
 
-    def _adjust_connection_pool(self):
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+
+    def _reset_after_fork(self):
+        """
+        子进程继承了父进程的连接，这些连接的socket和父进程共用，子进程里既不能使用也不能关闭，
+        只丢弃引用(pymysql回收连接时只关闭本进程的文件描述符，不会通知服务端)，之后在子进程里按需重新建立连接
         """
-        动态调整连接池大小.
+        with _fork_lock:
+            if self._pid == os.getpid():
+                return
+            self.__safe_lock = threading.RLock()
+            self._create_lock = threading.Lock()
+            self._borrowed_at = {}
+            self._pool_container = PoolContainer(self._max_pool_size, self._sticky_connections)
+            self._pid = os.getpid()
+        logger.info('[%s] Connection pool reset after fork', self)
+
+    def kill_query(self, thread_id):
         """
-        # 创建几个新连接
-        logger.debug('[{}] Adjust connection pool, '
-                     'current size is "{}"'.format(self, self.size))
+        通过一个不属于连接池的临时连接中断指定连接上正在执行的语句
+        连接池被占满时也能执行；新建连接同样经过熔断器，数据库不可用时不会被超时的语句反复重连
+        """
+        if not self._breaker.allow():
+            raise CircuitBreakerOpenError('[{}] Circuit breaker is open: {}'.format(self.pool_name,
+                                                                                  self._breaker.stats()))
+        try:
+            conn = self._create_connection()
+        except Exception:
+            self._breaker.record_failure()
+            raise
+        self._breaker.record_success()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('KILL QUERY %d' % int(thread_id))
+        finally:
+            conn.close()
 
-        if self.pool_size >= self._max_pool_size:
-            if self._enable_auto_resize:
-                self._adjust_max_pool_size()
+    def _adjust_connection_pool(self):
+        """
+        动态调整连接池大小，新建一个连接.
+        同一时间只有一个线程新建连接，其他线程返回False后等待空闲连接，数据库不可用时不会被并发重连压垮
+        """
+        if self._breaker.is_open():
+            raise CircuitBreakerOpenError('[{}] Circuit breaker is open: {}'.format(self.pool_name,
+                                                                                  self._breaker.stats()))
+        if not self._create_lock.acquire(False):
+            return False
 
         try:
-            connection = self._create_connection()
-        except Exception as err:
-            logger.error(err)
-            return False
-        else:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('[%s] Adjust connection pool, current size is "%s"', self, self.size)
+
+            if self.pool_size >= self._max_pool_size:
+                if self._sizing is not None:
+                    self._apply_sizing(monotonic())
+                elif self._enable_auto_resize:
+                    self._adjust_max_pool_size()
+                if self.pool_size >= self._max_pool_size:
+                    logger.debug('[%s] Connection pool is full now', self.pool_name)
+                    return False
+
+            if not self._breaker.allow():
+                # 半开状态下已经有探测连接在进行
+                return False
+
+            try:
+                connection = self._create_connection()
+            except Exception as err:
+                self._breaker.record_failure()
+                logger.error(err)
+                return False
+            self._breaker.record_success()
+
             try:
                 self._pool_container.add(connection)
             except PoolIsFullException:
-                logger.debug('[{}] Connection pool is full now'.format(self.pool_name))
+                logger.debug('[%s] Connection pool is full now', self.pool_name)
+                connection.close()
                 return False
             else:
                 return True
+        finally:
+            self._create_lock.release()
 
     def _adjust_max_pool_size(self):
         with self.__safe_lock:
-            self._max_pool_size *= self._auto_resize_scale
+            # 按比例扩大，至少加1(比例小于2时不能直接取整，否则1.5会变成2倍)
+            self._max_pool_size = max(self._max_pool_size + 1,
+                                      int(math.ceil(self._max_pool_size * self._auto_resize_scale)))
             if self._max_pool_size > self._pool_resize_boundary:
                 self._max_pool_size = self._pool_resize_boundary
-            logger.debug('[{}] Max pool size adjusted to {}'.format(self, self._max_pool_size))
+            logger.debug('[%s] Max pool size adjusted to %s', self, self._max_pool_size)
             self._pool_container.max_pool_size = self._max_pool_size
 
+    def _apply_sizing(self, now):
+        """
+        采样周期到期时按策略调整最大连接数，缩小时关闭多余的空闲连接，借出中的多余连接在归还时关闭
+        """
+        target = self._sizing.tick(self.pool_size, self._max_pool_size, now)
+        if target is None or target == self._max_pool_size:
+            return
+
+        with self.__safe_lock:
+            logger.info('[%s] Max pool size adjusted from %s to %s', self.pool_name, self._max_pool_size, target)
+            self._max_pool_size = target
+            self._pool_container.max_pool_size = target
+        for connection in self._pool_container.trim():
+            self._close_connection(connection)
+
+    @staticmethod
+    def _close_connection(connection):
+        try:
+            connection.close()
+        except Exception as err:
+            logger.debug(err)
+
     def _free(self):
         """
         释放所有连接
@@ -246,13 +475,13 @@ class MySQLConnectionPool(object):
 
     def _create_connection(self):
         """
-        创建pymysql连接
+        通过驱动创建连接
         """
-        return Connection(host=self._host,
-                          user=self._user,
-                          password=self._password,
-                          database=self._database,
-                          port=self._port,
-                          charset=self._charset,
-                          cursorclass=self._cursor_class,
-                          **self._other_kwargs)
+        return self._driver.connect(host=self._host,
+                                    user=self._user,
+                                    password=self._password,
+                                    database=self._database,
+                                    port=self._port,
+                                    charset=self._charset,
+                                    cursorclass=self._cursor_class,
+                                    **self._other_kwargs)
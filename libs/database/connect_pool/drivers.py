@@ -0,0 +1,151 @@
+import logging
+
+logger = logging.getLogger('pymysqlpool')
+
+__all__ = ['Driver', 'PyMySQLDriver', 'MySQLdbDriver', 'get_driver']
+
+
+class Driver(object):
+    """
+    DB-API驱动的适配层，连接池和DBBase只通过它使用驱动:
+        connect(**kwargs): 新建连接，参数使用pymysql的命名(password/database)，由各驱动转换
+        cursor_class(use_dict_cursor) / ss_cursor_class: 普通游标、dict游标和服务端游标
+        Error / OperationalError: 驱动的异常基类，错误码都在err.args[0]
+        multi_statements_flag: 允许多语句的client_flag
+        paramstyle: 驱动的参数风格，目前支持的驱动都是%s占位符，SQL中的?由DBBase统一替换
+        ping(conn): 检查连接是否可用，返回False时连接池丢弃这个连接
+        mogrify(cursor, sql, args): 在客户端把参数拼进SQL
+    """
+
+    name = None
+    paramstyle = None
+
+    def __repr__(self):
+        return '<{} {!r}>'.format(self.__class__.__name__, self.name)
+
+    def connect(self, **kwargs):
+        raise NotImplementedError
+
+    def cursor_class(self, use_dict_cursor):
+        return self.dict_cursor if use_dict_cursor else self.cursor
+
+    def ping(self, conn):
+        raise NotImplementedError
+
+    def mogrify(self, cursor, sql, args):
+        return cursor.mogrify(sql, args)
+
+
+class PyMySQLDriver(Driver):
+    """
+    纯python实现的pymysql
+    """
+
+    name = 'pymysql'
+
+    def __init__(self):
+        import pymysql
+        from pymysql.connections import Connection
+        from pymysql.constants import CLIENT
+        from pymysql.cursors import Cursor, DictCursor, SSCursor
+
+        self._connection_class = Connection
+        self.cursor = Cursor
+        self.dict_cursor = DictCursor
+        self.ss_cursor_class = SSCursor
+        self.Error = pymysql.Error
+        self.OperationalError = pymysql.OperationalError
+        self.multi_statements_flag = CLIENT.MULTI_STATEMENTS
+        self.paramstyle = pymysql.paramstyle
+
+    def connect(self, **kwargs):
+        return self._connection_class(**kwargs)
+
+    def ping(self, conn):
+        # 不在原连接上重连: 重连要经过连接池的熔断器和建连锁，断开的连接交给连接池丢弃
+        try:
+            conn.ping(reconnect=False)
+        except self.Error as err:
+            logger.debug('Drop broken connection: %s', err)
+            return False
+        return True
+
+
+class MySQLdbDriver(Driver):
+    """
+    C实现的mysqlclient(MySQLdb)，解析结果集比pymysql快很多
+    """
+
+    name = 'mysqldb'
+
+    def __init__(self):
+        import MySQLdb
+        from MySQLdb.constants import CLIENT
+        from MySQLdb.cursors import Cursor, DictCursor, SSCursor
+
+        self._connect = MySQLdb.connect
+        self.cursor = Cursor
+        self.dict_cursor = DictCursor
+        self.ss_cursor_class = SSCursor
+        self.Error = MySQLdb.Error
+        self.OperationalError = MySQLdb.OperationalError
+        self.multi_statements_flag = CLIENT.MULTI_STATEMENTS
+        self.paramstyle = MySQLdb.paramstyle
+
+    def connect(self, **kwargs):
+        if 'password' in kwargs:
+            kwargs['passwd'] = kwargs.pop('password') or ''
+        if 'database' in kwargs:
+            database = kwargs.pop('database')
+            if database is not None:
+                kwargs['db'] = database
+        for key in ('host', 'user'):
+            if kwargs.get(key) is None:
+                kwargs.pop(key, None)
+        return self._connect(**kwargs)
+
+    def ping(self, conn):
+        # mysqlclient不能在原连接上重连，断开的连接交给连接池丢弃
+        try:
+            conn.ping()
+        except self.Error as err:
+            logger.debug('Drop broken connection: %s', err)
+            return False
+        return True
+
+    def mogrify(self, cursor, sql, args):
+        if hasattr(cursor, 'mogrify'):
+            return cursor.mogrify(sql, args)
+        # mysqlclient 2.2之前的游标没有mogrify
+        conn = cursor.connection
+        if args is None:
+            return sql
+        if isinstance(args, dict):
+            literal = dict((k, conn.literal(v)) for k, v in args.items())
+        else:
+            literal = tuple(conn.literal(v) for v in args)
+        return (sql.encode(conn.encoding) % literal).decode(conn.encoding)
+
+
+DRIVERS = {
+    'pymysql': PyMySQLDriver,
+    'mysqldb': MySQLdbDriver,
+    'mysqlclient': MySQLdbDriver,
+}
+
+_instances = {}
+
+
+def get_driver(driver=None):
+    """
+    :param driver: 驱动名('pymysql'、'mysqldb'/'mysqlclient')或Driver实例，默认pymysql
+    :return: Driver instance
+    """
+    if isinstance(driver, Driver):
+        return driver
+    name = (driver or 'pymysql').lower()
+    if name not in DRIVERS:
+        raise ValueError('Unknown driver {!r}, expected one of {}'.format(driver, sorted(DRIVERS)))
+    if name not in _instances:
+        _instances[name] = DRIVERS[name]()
+    return _instances[name]
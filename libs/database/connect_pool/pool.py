@@ -1,6 +1,7 @@
 import logging
 import threading
-from queue import Queue, Empty
+from collections import deque
+from time import monotonic
 
 logger = logging.getLogger('pymysqlpool')
 
@@ -16,11 +17,22 @@ class PoolIsEmptyException(Exception):
 
 
 class PoolContainer(object):
-
-    def __init__(self, max_pool_size):
-        self._pool_lock = threading.RLock()
-        self._free_items = Queue()
+    """
+    连接容器，所有状态由一把锁(self._cond)保护:
+        _pool_items: 所有连接
+        _free_items: 空闲连接，后进先出，最近用过的连接优先被借出
+    sticky=True 时，线程归还的连接先停在该线程本地(_parked)，同一个线程再次借用时
+    不经过共享队列和锁直接拿回；其他线程没有空闲连接可用时会把停着的连接拿走
+    """
+
+    def __init__(self, max_pool_size, sticky=False):
+        self._cond = threading.Condition(threading.Lock())
+        self._free_items = deque()
         self._pool_items = set()
+        self._sticky = sticky
+        self._parked = {}
+        self._local = threading.local()
+        self._waiters = 0
         self._max_pool_size = 0
         self.max_pool_size = max_pool_size
 
@@ -28,16 +40,15 @@ class PoolContainer(object):
         return '<{0.__class__.__name__} {0.size})>'.format(self)
 
     def __iter__(self):
-        with self._pool_lock:
-            return iter(self._pool_items)
+        with self._cond:
+            return iter(list(self._pool_items))
 
     def __contains__(self, item):
-        with self._pool_lock:
-            return item in self._pool_items
+        # set的查询和len在GIL下是原子操作，不需要加锁
+        return item in self._pool_items
 
     def __len__(self):
-        with self._pool_lock:
-            return len(self._pool_items)
+        return len(self._pool_items)
 
     def add(self, item):
         """
@@ -46,31 +57,26 @@ class PoolContainer(object):
         if item is None:
             return None
 
-        """
-        拦截重复的连接
-        """
-        if item in self:
-            logger.debug(
-                'Duplicate item found "{}", '
-                'current size is "{}"'.format(item, self.size))
-            return None
+        with self._cond:
+            """
+            拦截重复的连接
+            """
+            if item in self._pool_items:
+                logger.debug('Duplicate item found "%s"', item)
+                return None
 
-        """
-        如果当前连接数量超过最大上线，抛出错误
-        """
-        if self.pool_size >= self.max_pool_size:
-            raise PoolIsFullException()
+            """
+            如果当前连接数量超过最大上线，抛出错误
+            """
+            if len(self._pool_items) >= self._max_pool_size:
+                raise PoolIsFullException()
 
-        """
-        往空闲的连接队列里放入新连接，并在线程安全的条件下放进连接池里
-        """
-        self._free_items.put_nowait(item)
-        with self._pool_lock:
             self._pool_items.add(item)
+            self._free_items.append(item)
+            self._cond.notify()
 
-        logger.debug(
-            'Add item "{!r}",'
-            ' current size is "{}"'.format(item, self.size))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Add item "%r", current size is "%s"', item, self.size)
 
     def return_(self, item):
         """
@@ -79,27 +85,109 @@ class PoolContainer(object):
         if item is None:
             return False
 
-        if item not in self:
-            logger.error(
-                'Current pool dose not contain item: "{}"'.format(item))
+        if item not in self._pool_items:
+            logger.error('Current pool dose not contain item: "%s"', item)
             return False
 
-        self._free_items.put_nowait(item)
-        logger.debug('Return item "{!r}", current size is "{}"'.format(item, self.size))
+        if self._sticky:
+            self._local.item = item
+            self._parked[item] = True
+            # 先停好再检查有没有等待者，等待者先登记再检查_parked，两边至少有一方能看到对方
+            if not self._waiters or self._parked.pop(item, None) is None:
+                return True
+
+        with self._cond:
+            self._free_items.append(item)
+            self._cond.notify()
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Return item "%r", current size is "%s"', item, self.size)
         return True
 
     def get(self, block=True, wait_timeout=60):
         """
         从队列里获取一个连接，如果在指定时间没有获取到，则抛出一个超时错误
         """
-        try:
-            item = self._free_items.get(block, timeout=wait_timeout)
-        except Empty:
+        if self._sticky:
+            item = getattr(self._local, 'item', None)
+            if item is not None:
+                self._local.item = None
+                # dict.pop是原子的，和其他线程抢同一个停着的连接时只有一方能拿到
+                if self._parked.pop(item, None) is not None:
+                    return item
+
+        with self._cond:
+            item = self._take()
+            if item is None and block:
+                deadline = None if wait_timeout is None else monotonic() + wait_timeout
+                self._waiters += 1
+                try:
+                    while item is None:
+                        item = self._take()
+                        if item is not None:
+                            break
+                        if deadline is None:
+                            self._cond.wait()
+                        else:
+                            remaining = deadline - monotonic()
+                            if remaining <= 0:
+                                break
+                            self._cond.wait(remaining)
+                finally:
+                    self._waiters -= 1
+
+        if item is None:
             raise PoolIsEmptyException('Cannot find any available item')
-        else:
-            logger.debug('Get item "{}",'
-                         ' current size is "{}"'.format(item, self.size))
-            return item
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Get item "%s", current size is "%s"', item, self.size)
+        return item
+
+    def remove(self, item):
+        """
+        从容器中移除一个连接(不关闭)，连接池缩小时用来淘汰归还的多余连接
+        """
+        with self._cond:
+            if item not in self._pool_items:
+                return False
+            self._pool_items.discard(item)
+            try:
+                self._free_items.remove(item)
+            except ValueError:
+                pass
+            self._parked.pop(item, None)
+        return True
+
+    def trim(self):
+        """
+        连接数超过最大连接数时移除多余的空闲连接，优先移除最久没用过的，返回被移除的连接(由调用方关闭)
+        """
+        removed = []
+        with self._cond:
+            while len(self._pool_items) > self._max_pool_size:
+                if self._free_items:
+                    item = self._free_items.popleft()
+                else:
+                    try:
+                        item = self._parked.popitem()[0]
+                    except KeyError:
+                        break
+                self._pool_items.discard(item)
+                removed.append(item)
+        return removed
+
+    def _take(self):
+        """
+        在锁内调用，优先取共享队列里的连接，其次拿走其他线程停着的连接
+        """
+        if self._free_items:
+            return self._free_items.pop()
+        while self._parked:
+            try:
+                return self._parked.popitem()[0]
+            except KeyError:
+                break
+        return None
 
     @property
     def size(self):
@@ -111,8 +199,12 @@ class PoolContainer(object):
 
     @max_pool_size.setter
     def max_pool_size(self, value):
-        if value > self._max_pool_size:
-            self._max_pool_size = value
+        """
+        可以扩大也可以缩小，缩小后多出来的连接通过trim()或归还时remove()淘汰
+        """
+        if value < 1:
+            raise ValueError('Invalid max pool size {}, must be at least 1'.format(value))
+        self._max_pool_size = value
 
     @property
     def pool_size(self):
@@ -120,4 +212,4 @@ class PoolContainer(object):
 
     @property
     def free_size(self):
-        return self._free_items.qsize()
+        return len(self._free_items) + len(self._parked)
@@ -0,0 +1,214 @@
+import math
+import logging
+import threading
+from collections import namedtuple
+from time import monotonic
+
+logger = logging.getLogger('pymysqlpool')
+
+__all__ = ['SizingSample', 'SizingPolicy', 'ScalePolicy', 'AIMDPolicy', 'LittlePolicy', 'SizingController']
+
+"""
+interval: 采样周期(秒)
+requests: 周期内开始借用的次数(包括还在排队的)，排队时借出次数跟不上到达的请求数，按它估算负载
+borrows: 周期内借出次数
+avg_wait / max_wait: 借用连接的平均/最长等待时间(秒)
+peak_in_use: 周期内同时借出的最大连接数
+avg_hold: 连接从借出到归还的平均时间(秒)，周期内没有归还时沿用上一个周期的值
+size: 当前连接数
+target: 当前最大连接数
+"""
+SizingSample = namedtuple('SizingSample', ['interval', 'requests', 'borrows', 'avg_wait', 'max_wait',
+                                           'peak_in_use', 'avg_hold', 'size', 'target'])
+
+
+class SizingPolicy(object):
+    """
+    连接池大小策略，根据一个周期的采样返回新的最大连接数，结果由SizingController限制在边界内
+    """
+
+    def target(self, sample):
+        raise NotImplementedError
+
+
+class ScalePolicy(SizingPolicy):
+    """
+    原来的策略: 出现借用等待时按比例扩大，不收缩
+    """
+
+    def __init__(self, scale=1.5, wait_threshold=0.001):
+        if scale <= 1:
+            raise ValueError('Invalid scale {}, must be bigger than 1'.format(scale))
+        self.scale = scale
+        self.wait_threshold = wait_threshold
+
+    def target(self, sample):
+        if sample.avg_wait > self.wait_threshold:
+            return max(sample.target + 1, int(math.ceil(sample.target * self.scale)))
+        return sample.target
+
+
+class AIMDPolicy(SizingPolicy):
+    """
+    平均等待超过阈值时扩大到growth倍(至少增加increase个)，连接闲置时乘法收缩(每个周期最多缩小到decrease倍，且不低于峰值并发+headroom)
+    每个周期只加固定个数跟不上负载的阶跃，排队会一直积压到追上为止，所以增长也按倍数
+    """
+
+    def __init__(self, increase=2, growth=2.0, decrease=0.8, wait_threshold=0.002, headroom=1):
+        if not 0 < decrease < 1:
+            raise ValueError('Invalid decrease {}, must be between 0 and 1'.format(decrease))
+        if growth < 1:
+            raise ValueError('Invalid growth {}, must not be smaller than 1'.format(growth))
+        self.increase = increase
+        self.growth = growth
+        self.decrease = decrease
+        self.wait_threshold = wait_threshold
+        self.headroom = headroom
+
+    def target(self, sample):
+        if sample.avg_wait > self.wait_threshold:
+            return max(sample.target + self.increase, int(math.ceil(sample.target * self.growth)))
+        floor = sample.peak_in_use + self.headroom
+        if floor < sample.target:
+            return max(floor, int(sample.target * self.decrease))
+        return sample.target
+
+
+class LittlePolicy(SizingPolicy):
+    """
+    按Little定律估算需要的并发: L = λ * W
+        λ: 每秒开始借用的次数(包括排队的请求，连接不够时借出次数会低估到达率), W: 平均持有时间
+    周期内没有借到连接的请求(requests - borrows)要在下个周期处理，按同样的持有时间计入需求
+    估算值做指数平滑后乘以headroom再加spare个备用连接，估算值直接给出需要的大小，负载阶跃时一个周期就能跟上；
+    收缩时每个周期最多缩小到shrink倍，估算值低于当前大小不到spare个连接时不收缩，避免连接反复新建和关闭
+    默认值在benchmarks/sizing_sim.py的三个场景里等待时间都低于ScalePolicy，平均连接数也更少
+    """
+
+    def __init__(self, headroom=1.5, spare=4, smoothing=0.3, shrink=0.9):
+        self.headroom = headroom
+        self.spare = spare
+        self.smoothing = smoothing
+        self.shrink = shrink
+        self._concurrency = None
+
+    def target(self, sample):
+        if sample.interval <= 0:
+            return sample.target
+        rate = max(sample.requests, sample.borrows) / sample.interval
+        backlog = max(0, sample.requests - sample.borrows) / sample.interval
+        load = (rate + backlog) * sample.avg_hold
+        if self._concurrency is None or load > self._concurrency:
+            # 负载上升时立即跟上，下降时平滑
+            self._concurrency = load
+        else:
+            self._concurrency += self.smoothing * (load - self._concurrency)
+
+        desired = int(math.ceil(self._concurrency * self.headroom)) + self.spare
+        if desired > sample.target:
+            return desired
+        if desired < sample.target - self.spare:
+            return max(desired, int(sample.target * self.shrink))
+        return sample.target
+
+
+class SizingController(object):
+    """
+    收集借用等待、并发和持有时间，每interval秒调用一次策略计算新的最大连接数
+    不启动后台线程，由连接池在借出/归还时检查是否到期(见MySQLConnectionPool)，离线模拟时可以传入模拟时钟
+    """
+
+    def __init__(self, policy, min_size=1, max_size=48, interval=1.0):
+        if min_size < 1 or min_size > max_size:
+            raise ValueError('Invalid pool size range [{}, {}]'.format(min_size, max_size))
+        self.policy = policy
+        self.min_size = min_size
+        self.max_size = max_size
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._tick_lock = threading.Lock()
+        self._started = None
+        self._next_tick = None
+        self._last_hold = 0.0
+        self._last_sample = None
+        self._reset()
+
+    def _reset(self):
+        self._requests = 0
+        self._borrows = 0
+        self._wait_sum = 0.0
+        self._max_wait = 0.0
+        self._peak_in_use = 0
+        self._releases = 0
+        self._hold_sum = 0.0
+
+    def observe_request(self):
+        with self._lock:
+            self._requests += 1
+
+    def observe_borrow(self, wait, in_use):
+        with self._lock:
+            self._borrows += 1
+            self._wait_sum += wait
+            if wait > self._max_wait:
+                self._max_wait = wait
+            if in_use > self._peak_in_use:
+                self._peak_in_use = in_use
+
+    def observe_release(self, hold):
+        with self._lock:
+            self._releases += 1
+            self._hold_sum += hold
+
+    def due(self, now=None):
+        now = monotonic() if now is None else now
+        if self._next_tick is None:
+            self._started = now
+            self._next_tick = now + self.interval
+            return False
+        return now >= self._next_tick
+
+    def tick(self, size, target, now=None):
+        """
+        到期时返回新的最大连接数，没到期或者其他线程正在计算时返回None
+        :param size: 当前连接数
+        :param target: 当前最大连接数
+        :param now: 当前时间，默认为time.monotonic()
+        """
+        now = monotonic() if now is None else now
+        if not self.due(now) or not self._tick_lock.acquire(False):
+            return None
+
+        try:
+            if not self.due(now):
+                return None
+            with self._lock:
+                if self._releases:
+                    self._last_hold = self._hold_sum / self._releases
+                sample = SizingSample(interval=now - self._started,
+                                      requests=self._requests,
+                                      borrows=self._borrows,
+                                      avg_wait=self._wait_sum / self._borrows if self._borrows else 0.0,
+                                      max_wait=self._max_wait,
+                                      peak_in_use=self._peak_in_use,
+                                      avg_hold=self._last_hold,
+                                      size=size,
+                                      target=target)
+                self._reset()
+            self._started = now
+            self._next_tick = now + self.interval
+            self._last_sample = sample
+
+            new_target = min(self.max_size, max(self.min_size, int(self.policy.target(sample))))
+            if new_target != target and logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Pool target %s -> %s (%r)', target, new_target, sample)
+            return new_target
+        finally:
+            self._tick_lock.release()
+
+    def stats(self):
+        return {
+            'policy': self.policy.__class__.__name__,
+            'min': self.min_size,
+            'max': self.max_size,
+            'last_sample': self._last_sample._asdict() if self._last_sample else None,
+        }
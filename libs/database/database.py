@@ -3,20 +3,107 @@
 
 __author__ = 'Knows'
 
+import asyncio
+import contextvars
+from collections import namedtuple
+
 from .db_core import DBBase
+from .singleflight import SingleFlight, flight_key
 
 """
 本来想做成可以级联调用的，比如 user.where(a=1, b=2).find()
 先写个low点的
 """
 
+BatchResult = namedtuple('BatchResult', ['rowcount', 'lastrowid'])
+
+
+class InsertResult(int):
+    """
+    insert的返回值，本身仍然是插入的行数，另外带上数据库生成的自增主键
+        lastrowid: 第一行的自增主键，表没有自增主键时为0
+        ids: 每一行的自增主键，无法确定时为None
+    """
+
+    def __new__(cls, rowcount, lastrowid=None, ids=None):
+        ret = super().__new__(cls, rowcount)
+        ret.lastrowid = lastrowid
+        ret.ids = ids
+        return ret
+
+
+def _insert_sql(table, cols):
+    return 'insert into `%s` (%s) values (%s)' % (table, ','.join(['`%s`' % col for col in cols]), ','.join(['?' for i in range(len(cols))]))
+
+
+class Batch(object):
+    """
+    收集多条写语句，退出with时在同一个连接上一次性发送
+        with db.batch() as b:
+            b.execute('update `counter` set `n`=`n`+1 where `id`=?', 1)
+            b.insert('audit', action='login')
+        b.results => [BatchResult(rowcount=1, lastrowid=0), BatchResult(rowcount=1, lastrowid=12)]
+    with块里抛出异常时，收集到的语句全部丢弃，不会发送
+    """
+
+    def __init__(self, db_base, transaction=False):
+        self._db_base = db_base
+        self._transaction = transaction
+        self._statements = []
+        self.results = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+        else:
+            self._statements = []
+        return False
+
+    def __len__(self):
+        return len(self._statements)
+
+    def execute(self, sql, *args):
+        """
+        加入一条语句，返回该语句的结果在results中的下标
+        :param sql: str
+        :param args: list
+        :return: int
+        """
+        self._statements.append((sql, args))
+        return len(self.results) + len(self._statements) - 1
+
+    def insert(self, table, **kw):
+        """
+        加入一条insert语句
+        :param table: str
+        :param kw: list
+        :return: int
+        """
+        cols, args = zip(*kw.items())
+        return self.execute(_insert_sql(table, cols), *args)
+
+    def flush(self):
+        """
+        发送已收集的语句
+        :return: list of BatchResult
+        """
+        statements, self._statements = self._statements, []
+        ret = self._db_base.execute_batch(statements, self._transaction)
+        self.results.extend(BatchResult(*r) for r in ret)
+        return self.results
+
 
 class DB(object):
 
     def __init__(self, engine):
         self.db_base = DBBase(engine)
+        self._single_flight = SingleFlight()
+        self._coalesce = getattr(engine, 'single_flight', False)
 
-    def select_one(self, sql, *args):
+    def select_one(self, sql, *args, timeout=None, coalesce=None):
         """
         执行SQL 仅返回一个结果
         如果没有结果 返回None
@@ -24,46 +111,122 @@ class DB(object):
         如果有多个结果，返回第一个结果
         :param sql: str
         :param args: list
+        :param timeout: float 超时秒数，默认使用engine的query_timeout
+        :param coalesce: 是否和同时发出的相同查询合并，默认使用engine的single_flight
         :return: Dict instance
         """
-        return self.db_base.query(sql, True, *args)
+        return self._query(sql, True, args, timeout, coalesce)
 
-    def select(self, sql, *args):
+    def select(self, sql, *args, timeout=None, coalesce=None):
         """
         执行sql 以列表形式返回结果
         :param sql: str
         :param args: list
+        :param timeout: float 超时秒数，默认使用engine的query_timeout
+        :param coalesce: 是否和同时发出的相同查询合并，默认使用engine的single_flight
         :return: Dict instance
         """
-        return self.db_base.query(sql, False, *args)
+        return self._query(sql, False, args, timeout, coalesce)
 
-    def execute(self, sql, *args):
+    async def select_one_async(self, sql, *args, timeout=None, coalesce=None, executor=None):
+        """
+        asyncio版本的select_one，查询在线程池(executor)中执行
+        """
+        return await self._query_async(sql, True, args, timeout, coalesce, executor)
+
+    async def select_async(self, sql, *args, timeout=None, coalesce=None, executor=None):
+        """
+        asyncio版本的select，查询在线程池(executor)中执行
+        """
+        return await self._query_async(sql, False, args, timeout, coalesce, executor)
+
+    def _flight_key(self, sql, first, args, timeout, coalesce):
+        if not (self._coalesce if coalesce is None else coalesce):
+            return None
+        return flight_key(sql, first, args + (timeout,))
+
+    def _query(self, sql, first, args, timeout, coalesce):
+        key = self._flight_key(sql, first, args, timeout, coalesce)
+        if key is None:
+            return self.db_base.query(sql, first, *args, timeout=timeout)
+        return self._single_flight.do(key, lambda: self.db_base.query(sql, first, *args, timeout=timeout))
+
+    async def _query_async(self, sql, first, args, timeout, coalesce, executor):
+        query = lambda: self.db_base.query(sql, first, *args, timeout=timeout)
+        key = self._flight_key(sql, first, args, timeout, coalesce)
+        if key is None:
+            # 带上调用方的上下文(诊断模式的记录器等)
+            return await asyncio.get_running_loop().run_in_executor(executor, contextvars.copy_context().run, query)
+        return await self._single_flight.do_async(key, query, executor)
+
+    def select_int(self, sql, *args, timeout=None):
+        """
+        执行SQL 返回第一行第一列的整数，比如 select count(*)
+        :param sql: str
+        :param args: list
+        :param timeout: float 超时秒数，默认使用engine的query_timeout
+        :return: int
+        """
+        d = self.db_base.query(sql, True, *args, timeout=timeout)
+        return int(next(iter(d.values()))) if d else 0
+
+    def execute(self, sql, *args, timeout=None):
         """
         执行sql 语句，返回执行的行数
         :param sql: str
         :param args: list
+        :param timeout: float 超时秒数，默认使用engine的query_timeout
         :return: int
         """
-        return self.db_base.execute(sql, *args)
+        return self.db_base.execute(sql, *args, timeout=timeout)
 
     def insert(self, table, **kw):
         """
         执行insert语句
         :param table: str
         :param kw: list
-        :return: int
+        :return: InsertResult instance 插入的行数，lastrowid为自增主键
         """
         cols, args = zip(*kw.items())
-        sql = 'insert into `%s` (%s) values (%s)' % (table, ','.join(['`%s`' % col for col in cols]), ','.join(['?' for i in range(len(cols))]))
-        return self.db_base.execute(sql, *args)
+        rowcount, lastrowid = self.db_base.insert(_insert_sql(table, cols), *args)
+        return InsertResult(rowcount, lastrowid, [lastrowid] if lastrowid else None)
 
-    def insert_many(self, table, fields=list(), values=list()):
+    def insert_many(self, table, fields=list(), values=list(), chunk_size=1000):
         """
-        执行insert语句
+        执行多行insert语句，每chunk_size行拼成一条语句
+        自增主键连续时(见DBBase.autoinc_increment)，由每条语句的第一个自增主键和行数推算出所有行的主键
         :param table:
         :param fields:
         :param values:
-        :return: int
+        :param chunk_size: int
+        :return: InsertResult instance 插入的行数，ids为每一行的自增主键
+        """
+        row = '(%s)' % ','.join(['?' for field in fields])
+        rowcount, first_id, ids = 0, None, []
+
+        for i in range(0, len(values), chunk_size):
+            chunk = values[i:i + chunk_size]
+            sql = 'insert into `%s` (%s) values %s' % (table, ','.join(['`%s`' % field for field in fields]), ','.join([row] * len(chunk)))
+            n, lastrowid = self.db_base.insert(sql, *[arg for value in chunk for arg in value])
+            rowcount += n
+            if first_id is None:
+                first_id = lastrowid
+
+            increment = None
+            if ids is not None and lastrowid:
+                increment = self.db_base.autoinc_increment() if n > 1 else 1
+            if increment:
+                ids.extend(lastrowid + j * increment for j in range(n))
+            else:
+                ids = None
+
+        return InsertResult(rowcount, first_id, ids)
+
+    def batch(self, transaction=False):
+        """
+        批量执行写语句，所有语句在同一个连接上发送
+        连接池开启multi_statements时只需一次网络往返
+        :param transaction: boolean 是否包在一个事务里
+        :return: Batch instance
         """
-        sql = 'insert into `%s` (%s) values (%s)' % (table, ','.join(['`%s`' % field for field in fields]), ','.join(['%s' for field in fields]))
-        return self.db_base.executemany(sql, values)
+        return Batch(self.db_base, transaction)
@@ -4,9 +4,12 @@
 __author__ = 'Knows'
 
 import logging
+import threading
 
 from libs.classes.dict_class import Dict
 from utils.decorator import sql_profiling_decorator
+from .diagnostics import recorded
+from .timeout import Watchdog, NO_WATCHDOG, WATCHDOG_GRACE, with_max_execution_time
 
 logger = logging.getLogger('pymysql')
 
@@ -14,51 +17,114 @@ logger = logging.getLogger('pymysql')
 class DBBase(object):
     def __init__(self, db_engine):
         self.engine = db_engine
-        self.connection = db_engine.connect()
+        self._connection = None
+        self._connect_lock = threading.Lock()
+        self._autoinc_settings = None
+
+    @property
+    def connection(self):
+        """
+        连接池在第一次执行语句时才创建，导入和初始化时不连接数据库
+        """
+        if self._connection is None:
+            with self._connect_lock:
+                if self._connection is None:
+                    self._connection = self.engine.connect()
+        return self._connection
 
     @property
     def cursor_builder(self):
         return self.connection.cursor
 
+    def _watchdog(self, cursor, sql, timeout, grace=0):
+        """
+        超时为0/None时不启动看门狗
+        """
+        if not timeout:
+            return NO_WATCHDOG
+        return Watchdog(self.connection, cursor.connection, timeout, sql, grace)
+
     @sql_profiling_decorator
-    def query(self, sql, first, *args):
+    @recorded(args_offset=1)
+    def query(self, sql, first, *args, timeout=None):
         """
         执行SQL，返回一个结果 或者多个结果组成的列表
         :param sql: str
         :param first: boolean
         :param args: list
+        :param timeout: float 超时秒数，超时抛出QueryTimeoutError
         :return: Dict instance
         """
         names = []
         sql = sql.replace('?', '%s')
+        timeout = self.engine.query_timeout if timeout is None else timeout
+        hinted = False
+        if timeout:
+            sql, hinted = with_max_execution_time(sql, timeout)
 
         with self.cursor_builder() as cursor:
-            cursor.execute(sql, args)
-            if cursor.description:
-                names = [x[0] for x in cursor.description]
-            if first:
-                values = cursor.fetchone()
-                if not values:
-                    return None
-                return Dict(names, values)
-            return [Dict(names, x) for x in cursor.fetchall()]
+            with self._watchdog(cursor, sql, timeout, WATCHDOG_GRACE if hinted else 0):
+                cursor.execute(sql, args)
+                if cursor.description:
+                    names = [x[0] for x in cursor.description]
+                if first:
+                    values = cursor.fetchone()
+                    if not values:
+                        return None
+                    return Dict(names, values)
+                return [Dict(names, x) for x in cursor.fetchall()]
 
     @sql_profiling_decorator
-    def execute(self, sql, *args):
+    @recorded()
+    def execute(self, sql, *args, timeout=None):
         """
         执行update 语句，返回update的行数
         :param sql: str
         :param args: list
+        :param timeout: float 超时秒数，超时抛出QueryTimeoutError
         :return: int
         """
         sql = sql.replace('?', '%s')
+        timeout = self.engine.query_timeout if timeout is None else timeout
+
+        with self.cursor_builder() as cursor:
+            with self._watchdog(cursor, sql, timeout):
+                cursor.execute(sql, args)
+                r = cursor.rowcount
+                return r
+
+    @sql_profiling_decorator
+    @recorded()
+    def insert(self, sql, *args):
+        """
+        执行insert 语句，返回插入的行数和自增主键
+        多行insert时，lastrowid是第一行的自增主键
+        :param sql: str
+        :param args: list
+        :return: tuple (rowcount, lastrowid)
+        """
+        sql = sql.replace('?', '%s')
 
         with self.cursor_builder() as cursor:
             cursor.execute(sql, args)
-            r = cursor.rowcount
-            return r
+            return cursor.rowcount, cursor.lastrowid
+
+    def autoinc_increment(self):
+        """
+        多行insert生成的自增主键是否连续，连续时返回自增步长，否则返回None
+        innodb_autoinc_lock_mode为0(traditional)或1(consecutive)时，
+        一条多行insert拿到的自增主键是连续的；为2(interleaved)时可能与其他会话交错
+        :return: int or None
+        """
+        if self._autoinc_settings is None:
+            d = self.query('select @@innodb_autoinc_lock_mode as lock_mode, '
+                           '@@auto_increment_increment as increment', True)
+            self._autoinc_settings = (int(d['lock_mode']), int(d['increment']))
+        lock_mode, increment = self._autoinc_settings
+        return increment if lock_mode in (0, 1) else None
 
     @sql_profiling_decorator
+    @recorded()
     def executemany(self, sql, *args):
         """
         执行update 语句，返回update的行数
@@ -72,4 +138,49 @@ class DBBase(object):
             ret = cursor.executemany(sql, *args)
             return ret
 
+    @sql_profiling_decorator
+    @recorded()
+    def execute_batch(self, statements, transaction=False):
+        """
+        在同一个连接上执行多条语句，返回每条语句的(rowcount, lastrowid)
+        连接池开启了multi_statements时，在批量执行专用的连接上把所有语句拼接后一次发送，只需要一次网络往返；
+        否则在同一个连接上逐条执行
+        :param statements: list of (sql, args)
+        :param transaction: boolean 是否包在一个事务里
+        :return: list
+        """
+        if not statements:
+            return []
+
+        statements = [(sql.replace('?', '%s'), args) for sql, args in statements]
 
+        with self.connection.batch_connection(not transaction) as conn:
+            cursor = conn.cursor()
+            try:
+                if self.connection.multi_statements:
+                    results = self._execute_multi_statements(cursor, statements)
+                else:
+                    results = []
+                    for sql, args in statements:
+                        cursor.execute(sql, args)
+                        results.append((cursor.rowcount, cursor.lastrowid))
+                if transaction:
+                    conn.commit()
+                return results
+            except Exception as err:
+                if transaction:
+                    conn.rollback()
+                raise err
+            finally:
+                cursor.close()
+
+    def _execute_multi_statements(self, cursor, statements):
+        """
+        把参数在客户端转义后用分号拼成一条语句发送，再通过nextset逐个读取每条语句的结果
+        """
+        mogrify = self.connection.driver.mogrify
+        cursor.execute(';\n'.join(mogrify(cursor, sql, args) for sql, args in statements))
+        results = [(cursor.rowcount, cursor.lastrowid)]
+        while cursor.nextset():
+            results.append((cursor.rowcount, cursor.lastrowid))
+        return results
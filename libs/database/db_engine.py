@@ -12,8 +12,10 @@ class _Engine(object):
     用于保存 db模块的核心函数：create_engine 创建出来的数据库连接
     """
 
-    def __init__(self, connect):
+    def __init__(self, connect, query_timeout=None, single_flight=False):
         self._connect = connect
+        self.query_timeout = query_timeout
+        self.single_flight = single_flight
 
     def connect(self):
         return self._connect()
@@ -23,8 +25,12 @@ def create_engine(**kw):
     """
     db模型的核心函数，用于连接数据库, 生成全局对象engine，
     engine对象持有数据库连接
+    query_timeout: 默认的语句超时(秒)，可以在每次查询时用timeout参数覆盖
+    single_flight: select/select_one默认是否合并同时发出的相同查询(见singleflight.py)，可以在每次查询时用coalesce参数覆盖
     """
+    query_timeout = kw.pop('query_timeout', None)
+    single_flight = kw.pop('single_flight', False)
     defaults = dict(use_unicode=True, charset='utf8', autocommit=False)
     defaults.update(kw)
-    engine = _Engine(lambda: ConnectionPool(**defaults))
+    engine = _Engine(lambda: ConnectionPool(**defaults), query_timeout, single_flight)
     return engine
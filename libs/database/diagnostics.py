@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+SQL诊断模式，默认关闭，只在record_queries的with块里生效:
+    with record_queries(explain=True) as recorder:
+        users = User.find_by('where org_id=?', 1)
+        for u in users:
+            Profile.get(u.id)
+    recorder.count               # 执行了多少条语句
+    recorder.n_plus_one()        # [('select * from profile where id=?', 20)]
+    recorder.plan_warnings       # EXPLAIN 发现的全表扫描/filesort
+
+测试中可以用 assert_max_queries 限制语句数量:
+    with assert_max_queries(3):
+        ...
+记录器保存在contextvars里，每个请求/线程/协程互不影响；
+DB.select_async等放到线程池执行的查询会带上调用方的上下文，同样计入调用方的记录器
+"""
+
+import re
+import time
+import functools
+import contextlib
+import contextvars
+from collections import namedtuple, Counter
+
+QueryRecord = namedtuple('QueryRecord', ['sql', 'args', 'shape', 'elapsed'])
+PlanWarning = namedtuple('PlanWarning', ['shape', 'table', 'reason'])
+
+_recorder = contextvars.ContextVar('query_recorder', default=None)
+
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bin\s*\(\s*(?:\?\s*,\s*)*\?\s*\)', re.I)
+_SPACE_RE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def normalize_sql(sql):
+    """
+    把语句中的字面量替换成?，in列表折叠成in (...)，得到语句的"形状"
+    :param sql: str
+    :return: str
+    """
+    shape = sql.replace('%s', '?')
+    shape = _STRING_RE.sub('?', shape)
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = _IN_LIST_RE.sub('in (...)', shape)
+    return _SPACE_RE.sub(' ', shape).strip().lower()
+
+
+class QueryRecorder(object):
+    """
+    记录一段代码中执行过的语句
+    :param explain: 是否对新出现的select形状执行EXPLAIN
+    :param n_plus_one_threshold: 同一个形状执行多少次算作N+1
+    """
+
+    def __init__(self, explain=False, n_plus_one_threshold=5):
+        self.explain = explain
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.queries = []
+        self.shapes = Counter()
+        self.plan_warnings = []
+        self._explaining = False
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def record(self, db_base, sql, args, elapsed):
+        if self._explaining:
+            return
+        shape = normalize_sql(sql)
+        self.shapes[shape] += 1
+        self.queries.append(QueryRecord(sql, args, shape, elapsed))
+        if self.explain and self.shapes[shape] == 1 and shape.startswith('select'):
+            self._explain(db_base, sql, args, shape)
+
+    def n_plus_one(self, threshold=None):
+        """
+        返回执行次数达到阈值的语句形状
+        :return: list of (shape, count)
+        """
+        threshold = threshold or self.n_plus_one_threshold
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+    def _explain(self, db_base, sql, args, shape):
+        self._explaining = True
+        try:
+            with db_base.cursor_builder() as cursor:
+                cursor.execute('explain ' + sql.replace('?', '%s'), args)
+                names = [x[0] for x in cursor.description]
+                rows = [r if isinstance(r, dict) else dict(zip(names, r)) for r in cursor.fetchall()]
+        except Exception as err:
+            self.plan_warnings.append(PlanWarning(shape, None, 'explain failed: %s' % err))
+            return
+        finally:
+            self._explaining = False
+
+        for r in rows:
+            if r.get('type') == 'ALL':
+                self.plan_warnings.append(PlanWarning(shape, r.get('table'), 'full table scan'))
+            if 'filesort' in (r.get('Extra') or ''):
+                self.plan_warnings.append(PlanWarning(shape, r.get('table'), 'using filesort'))
+
+
+def current_recorder():
+    return _recorder.get()
+
+
+@contextlib.contextmanager
+def record_queries(explain=False, n_plus_one_threshold=5):
+    """
+    在当前上下文(线程或协程)中开启诊断模式，可以嵌套，退出时恢复外层的记录器
+    """
+    recorder = QueryRecorder(explain, n_plus_one_threshold)
+    outer = current_recorder()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+        if outer is not None:
+            outer.queries.extend(recorder.queries)
+            outer.shapes.update(recorder.shapes)
+            outer.plan_warnings.extend(recorder.plan_warnings)
+
+
+@contextlib.contextmanager
+def assert_max_queries(n, explain=False):
+    """
+    with块中执行的语句超过n条时抛出QueryBudgetExceeded
+    """
+    with record_queries(explain) as recorder:
+        yield recorder
+    if recorder.count > n:
+        raise QueryBudgetExceeded('Expected at most %s queries, %s were executed:\n%s' % (
+            n, recorder.count, '\n'.join(q.sql for q in recorder.queries)))
+
+
+def recorded(args_offset=0):
+    """
+    DBBase的执行方法使用，诊断模式关闭时只多一次上下文变量的读取
+    :param args_offset: sql后面有几个位置参数不是语句的参数，比如query的first
+    """
+
+    def _decorator(func):
+        @functools.wraps(func)
+        def _wrapper(db_base, sql, *args, **kw):
+            recorder = _recorder.get()
+            if recorder is None:
+                return func(db_base, sql, *args, **kw)
+
+            start = time.time()
+            try:
+                return func(db_base, sql, *args, **kw)
+            finally:
+                elapsed = time.time() - start
+                if isinstance(sql, list):
+                    # execute_batch: [(sql, args), ...]
+                    for s, a in sql:
+                        recorder.record(db_base, s, a, elapsed / len(sql))
+                else:
+                    recorder.record(db_base, sql, args[args_offset:], elapsed)
+
+        return _wrapper
+
+    return _decorator
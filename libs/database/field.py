@@ -20,7 +20,7 @@ self._order: 实例属性，实例化时从类属性处得到，用于记录该
            INFO:root:[TEST _COUNT] id => 0
            INFO:root:[TEST _COUNT] last_modified => 4
            INFO:root:[TEST _COUNT] email => 2
-       最后生成__sql时（见_gen_sql 函数），这些字段就是按序排列
+       最后生成建表语句时（见schema.gen_sql 函数），这些字段就是按序排列
            create table `user` (
                `id` bigint not null,
                `name` varchar(255) not null,
@@ -29,6 +29,8 @@ self._order: 实例属性，实例化时从类属性处得到，用于记录该
                `last_modified` real not null,
                primary key(`id`)
            );
+self.index / self.unique: 是否给该字段单独建一个普通索引/唯一索引，组合索引在Model的__indexes__中声明（见Index类）
+self.deferred: 大字段模式，查询时不读取该字段，实例上的值是一个可以分块读写的LargeObject（见lob.py），用于BlobField/TextField
 self._default: 用于让orm自己填入缺省值，缺省值可以是可调用对象，比如函数
            比如：passwd 字段 <StringField:passwd,varchar(255),default(<function <lambda> at 0x0000000002A13898>),UI>
                 这里passwd的默认值就可以通过返回的函数调用取得
@@ -51,6 +53,9 @@ class Field(object):
         self.updatable = kw.get('updatable', True)
         self.insertable = kw.get('insertable', True)
         self.ddl = kw.get('ddl', '')
+        self.index = kw.get('index', False)
+        self.unique = kw.get('unique', False)
+        self.deferred = kw.get('deferred', False)
         """
         不理解_order和_count干嘛用的，看最上面的注释
         """
@@ -79,6 +84,26 @@ class Field(object):
         return ''.join(s)
 
 
+class Index(object):
+    """
+    保存一个索引的属性，可以是组合索引，在Model的__indexes__中声明
+        __indexes__ = [
+            ('user_id', 'insert_time'),
+            Index('email', 'deleted', unique=True),
+        ]
+    name为空时由Model按 idx_表名_字段名 / uk_表名_字段名 自动生成
+    """
+    def __init__(self, *fields, **kw):
+        if not fields:
+            raise ValueError('Index must contain at least 1 field')
+        self.fields = tuple(fields)
+        self.unique = kw.get('unique', False)
+        self.name = kw.get('name', None)
+
+    def __str__(self):
+        return '<%s:%s,(%s)%s>' % (self.__class__.__name__, self.name, ','.join(self.fields), ',UNIQUE' if self.unique else '')
+
+
 class StringField(Field):
     """
     保存String类型字段的属性
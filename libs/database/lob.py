@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+大字段(BlobField/TextField 设置 deferred=True)的流式读写
+
+查询时大字段不会出现在select的字段列表里，Model实例上对应的值是一个LargeObject，
+需要时再分块读取:
+    doc = Document.get(1)
+    with open('/tmp/doc.pdf', 'wb') as f:
+        doc.content.read_into(f)                 # 写入文件
+    buf = bytearray(doc.content.length())
+    doc.content.read_into(buf)                   # 写入调用方提供的缓冲区
+
+写入时值可以是文件对象或者bytes的可迭代对象，insert时在同一个事务里先插入空值，再分块写入:
+    Document(name='a.pdf', content=open('a.pdf', 'rb')).insert()
+    doc.content.write_from(open('b.pdf', 'rb'))
+分块先在会话变量里拼接(set @v=concat(@v, 块))，最后用一条update写入字段，行只改写一次，binlog里也只有一个行镜像；
+拼接本身在服务端内存里复制，总长度受服务端max_allowed_packet限制，超过时抛出ValueError
+insert_many、延迟写入队列和load_from不支持流式写入，大字段的值是文件对象、可迭代对象或LargeObject时抛出TypeError
+"""
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+_VARIABLE = '@_orm_lob'
+
+
+class LargeObject(object):
+    """
+    某一行上的一个大字段，只保存定位信息，不保存内容
+    """
+
+    def __init__(self, model, field, pk_value, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.model = model
+        self.field = field
+        self.pk_value = pk_value
+        self.chunk_size = chunk_size
+        self._length = None
+
+    def __repr__(self):
+        return '<LargeObject %s.%s pk=%r>' % (self.model.__table__, self.field.name, self.pk_value)
+
+    @property
+    def binary(self):
+        return 'blob' in self.field.ddl or 'binary' in self.field.ddl
+
+    def length(self):
+        """
+        字段长度，blob按字节、text按字符计算，结果会缓存
+        """
+        if self._length is None:
+            d = self._db().select_one('select %s(`%s`) as len from `%s` where `%s`=?' % (
+                'length' if self.binary else 'char_length', self.field.name, self.model.__table__,
+                self.model.__primary_key__.name), self.pk_value)
+            self._length = int(d['len'] or 0) if d else 0
+        return self._length
+
+    def iter_chunks(self, chunk_size=None):
+        """
+        在同一个连接上按块读取，每块一次查询
+        """
+        chunk_size = chunk_size or self.chunk_size
+        sql = 'select substring(`%s`, %%s, %%s) from `%s` where `%s`=%%s' % (
+            self.field.name, self.model.__table__, self.model.__primary_key__.name)
+        offset = 1
+        with self._db().db_base.cursor_builder() as cursor:
+            while True:
+                cursor.execute(sql, (offset, chunk_size, self.pk_value))
+                row = cursor.fetchone()
+                chunk = (list(row.values())[0] if isinstance(row, dict) else row[0]) if row else None
+                if not chunk:
+                    return
+                yield chunk
+                if len(chunk) < chunk_size:
+                    return
+                offset += len(chunk)
+
+    def read_into(self, target, chunk_size=None):
+        """
+        读取到调用方提供的缓冲区(bytearray/memoryview等可写缓冲区)或者有write方法的文件对象
+        写缓冲区时通过memoryview切片直接写入，不拼接中间结果
+        :return: int 读取的长度
+        """
+        if hasattr(target, 'write'):
+            n = 0
+            for chunk in self.iter_chunks(chunk_size):
+                target.write(chunk)
+                n += len(chunk)
+            return n
+
+        if not self.binary:
+            raise TypeError('Text field `%s` can only be read into a file object' % self.field.name)
+
+        view = memoryview(target).cast('B')
+        n = 0
+        for chunk in self.iter_chunks(chunk_size):
+            if n + len(chunk) > len(view):
+                raise ValueError('Buffer too small for field `%s`' % self.field.name)
+            view[n:n + len(chunk)] = chunk
+            n += len(chunk)
+        return n
+
+    def read(self):
+        """
+        一次读出全部内容
+        """
+        if not self.binary:
+            return ''.join(self.iter_chunks())
+        buf = bytearray(self.length())
+        n = self.read_into(buf)
+        return buf if n == len(buf) else buf[:n]
+
+    def write_from(self, source, chunk_size=None):
+        """
+        用文件对象或者可迭代对象的内容替换字段的值，按块拼接后在一个事务里一次写入
+        :return: int 写入的长度
+        """
+        with self._db().db_base.connection.connection(False) as conn:
+            cursor = conn.cursor()
+            try:
+                n = self._write(cursor, source, chunk_size)
+                conn.commit()
+            except Exception as err:
+                conn.rollback()
+                raise err
+            finally:
+                cursor.close()
+        return n
+
+    def _write(self, cursor, source, chunk_size=None):
+        """
+        在调用方的事务里写入，见模块说明
+        """
+        chunk_size = chunk_size or self.chunk_size
+        n = 0
+        cursor.execute('set %s=%%s' % _VARIABLE, (b'' if self.binary else '',))
+        try:
+            sql = 'set %s=concat(%s, %%s)' % (_VARIABLE, _VARIABLE)
+            for chunk in iter_source(source, chunk_size):
+                cursor.execute(sql, (chunk,))
+                n += len(chunk)
+
+            # 超过max_allowed_packet时concat的结果是NULL(只产生一个warning)
+            cursor.execute('select %s is not null' % _VARIABLE)
+            row = cursor.fetchone()
+            if not (list(row.values())[0] if isinstance(row, dict) else row[0]):
+                raise ValueError('Field `%s` is too large (%s), check max_allowed_packet' % (self.field.name, n))
+            cursor.execute('update `%s` set `%s`=%s where `%s`=%%s' % (
+                self.model.__table__, self.field.name, _VARIABLE, self.model.__primary_key__.name), (self.pk_value,))
+        finally:
+            # 连接会回到连接池，不要让它一直占着这块内存
+            try:
+                cursor.execute('set %s=null' % _VARIABLE)
+            except Exception:
+                pass
+        self._length = n
+        return n
+
+    def _db(self):
+        return self.model._get_db()
+
+
+def insert_with_streams(model, params, streams):
+    """
+    在一个事务里插入一行并写入流式的大字段，任何一步失败整行回滚
+    :param params: {列名: 值}，不包含streams里的字段
+    :param streams: [(field, 文件对象或可迭代对象), ...]
+    :return: (lastrowid, [LargeObject, ...])
+    """
+    table, pk = model.__table__, model.__primary_key__.name
+    lobs = [LargeObject(model, field, None) for field, source in streams]
+    params = dict(params)
+    for lob in lobs:
+        params[lob.field.name] = b'' if lob.binary else ''
+    cols = list(params)
+    sql = 'insert into `%s` (%s) values (%s)' % (table, ','.join(['`%s`' % c for c in cols]),
+                                                 ','.join(['%s'] * len(cols)))
+    with model._get_db().db_base.connection.connection(False) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, [params[c] for c in cols])
+            lastrowid = cursor.lastrowid
+            for lob, (field, source) in zip(lobs, streams):
+                lob.pk_value = params.get(pk) or lastrowid
+                lob._write(cursor, source)
+            conn.commit()
+        except Exception as err:
+            conn.rollback()
+            raise err
+        finally:
+            cursor.close()
+    return lastrowid, lobs
+
+
+def check_inline(field, value):
+    """
+    批量写入(insert_many/延迟写入/load_from)只支持直接给出的值
+    """
+    if isinstance(value, LargeObject) or is_stream(value):
+        raise TypeError('Field `%s` holds a %s, stream it with Model.insert() or LargeObject.write_from() '
+                        'instead of a bulk insert' % (field.name, type(value).__name__))
+    return value
+
+
+def is_stream(value):
+    """
+    是否是需要分块写入的值(文件对象或者bytes/str以外的可迭代对象)
+    """
+    if isinstance(value, (bytes, bytearray, str, LargeObject)) or value is None:
+        return False
+    return hasattr(value, 'read') or hasattr(value, '__iter__')
+
+
+def iter_source(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    按块读取文件对象或者可迭代对象
+    二进制文件用readinto读入同一个缓冲区，满块时直接发送该缓冲区，不再另外复制
+    """
+    if hasattr(source, 'readinto'):
+        buf = bytearray(chunk_size)
+        while True:
+            n = source.readinto(buf)
+            if not n:
+                return
+            yield buf if n == chunk_size else buf[:n]
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        for chunk in source:
+            if chunk:
+                yield chunk
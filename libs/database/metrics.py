@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+进程内的计数器，比如 query_timeout(语句超时次数)
+    metrics.snapshot() => {'query_timeout': 3}
+"""
+
+import threading
+from collections import Counter
+
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def incr(name, n=1):
+    with _lock:
+        _counters[name] += n
+
+
+def snapshot():
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
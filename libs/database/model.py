@@ -13,18 +13,50 @@ __author__ = 'Knows'
     5. 新增"__table__"属性，保存提取出来的表名
 """
 
+import os
+import time
 import logging
-from .field import Field
-from . import db
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .field import Field, FloatField, Index
+from .schema import record_lookup, where_columns
+from .diagnostics import current_recorder
+from .lob import LargeObject, is_stream, insert_with_streams, check_inline
+from . import bulk
+from . import aggregate as _aggregate
+from .write_behind import WriteBehindQueue
+from . import get_database
+
+
+_write_behind_lock = threading.Lock()
+
+# get_many的并行查询线程池，每个连接池一个，线程数不超过连接池允许的最大连接数
+_get_many_executors = {}
+_get_many_lock = threading.Lock()
+
+
+def _get_many_executor(db):
+    pool = db.db_base.connection
+    # fork之后线程池里的线程不存在了，子进程使用新的线程池
+    key = (os.getpid(), pool.pool_name)
+    executor = _get_many_executors.get(key)
+    if executor is None:
+        with _get_many_lock:
+            executor = _get_many_executors.get(key)
+            if executor is None:
+                executor = ThreadPoolExecutor(pool.pool_resize_boundary,
+                                              thread_name_prefix='get-many-%s' % pool.pool_name)
+                _get_many_executors[key] = executor
+    return executor
 
 
 class ModelMetaclass(type):
 
-    __defaultFields = frozenset(['insert_time', 'update_time'])
+    __defaultFields = ('insert_time', 'update_time')
 
     def __new__(mcs, model_name, bases, attrs):
         # 跳过Model类:
-        if model_name == 'Mode':
+        if model_name == 'Model':
             return type.__new__(mcs, model_name, bases, attrs)
 
         # 记录所有Model子类名称:
@@ -33,9 +65,9 @@ class ModelMetaclass(type):
         if model_name not in mcs.subclasses:
             mcs.subclasses[model_name] = model_name
         else:
-            logging.warning('Redefine class: %s' % model_name)
+            logging.warning('Redefine class: %s', model_name)
 
-        logging.info('Scan ORMapping %s...' % model_name)
+        logging.debug('Scan ORMapping %s...', model_name)
 
         mappings = dict()
         primary_key = None
@@ -45,17 +77,17 @@ class ModelMetaclass(type):
                 # 如果Field没有定义name属性，则把传入的key当做字段名
                 if not v.name:
                     v.name = k
-                logging.info('[MAPPING] Found mapping: %s => %s' % (k, v))
+                logging.debug('[MAPPING] Found mapping: %s => %s', k, v)
 
                 # 检查索引相关配置:
                 if v.primary_key:
                     if primary_key:
                         raise TypeError('Cannot define more than 1 primary key in class: %s' % model_name)
                     if v.updatable:
-                        logging.warning('NOTE: change primary key to non-updatable.')
+                        logging.debug('NOTE: change primary key to non-updatable.')
                         v.updatable = False
                     if v.nullable:
-                        logging.warning('NOTE: change primary key to non-nullable.')
+                        logging.debug('NOTE: change primary key to non-nullable.')
                         v.nullable = False
                     primary_key = v
                 mappings[k] = v
@@ -74,15 +106,74 @@ class ModelMetaclass(type):
 
         attrs['__mappings__'] = mappings
         attrs['__primary_key__'] = primary_key
-
-        # 如果model子类没有设置__timestamp_field__字段为False，那么就自动增加insert_time和update_time两个字段
-        if '__timestamp_field__' in attrs and not attrs['__timestamp_field__']:
-                if mcs.__defaultFields not in attrs:
-                    attrs[mcs.__defaultFields] = None
+        mcs._check_indexes(attrs['__table__'], mappings, attrs.get('__indexes__', ()))
+
+        # 只有显式设置__timestamp_field__ = True(或者继承自这样设置的父类)时，才自动增加insert_time和update_time两个字段，
+        # 已有的表里通常没有这两列，默认不增加
+        timestamp_field = attrs.get('__timestamp_field__', any(getattr(b, '__timestamp_field__', False) is True
+                                                                for b in bases))
+        if timestamp_field is True:
+            added = []
+            for name in mcs.__defaultFields:
+                if name not in mappings:
+                    mappings[name] = FloatField(name=name, default=time.time, updatable=(name == 'update_time'))
+                    added.append(name)
+            attrs['_timestamp_fields'] = tuple(added)
         return type.__new__(mcs, model_name, bases, attrs)
 
-
-class Model(dict, mateclass=ModelMetaclass):
+    @staticmethod
+    def _check_indexes(table, mappings, declared):
+        """
+        定义Model时只检查__indexes__中的字段是否存在，命名和整理留给_scan_indexes
+        """
+        if not declared:
+            return
+        columns = set(mappings)
+        columns.update(v.name for v in mappings.values())
+        for index in declared:
+            if isinstance(index, str):
+                fields = (index,)
+            elif isinstance(index, Index):
+                fields = index.fields
+            else:
+                fields = index
+            for field in fields:
+                if field not in columns:
+                    raise TypeError('Index field `%s` not defined in table: %s' % (field, table))
+
+    @staticmethod
+    def _scan_indexes(table, mappings, declared):
+        """
+        把字段上的index/unique和__indexes__中声明的组合索引统一成Index对象，并检查字段是否存在
+        在第一次用到索引时才调用(见Model._get_indexes)，定义Model时不做这些工作
+        """
+        columns = dict((k, v.name) for k, v in mappings.items())
+        columns.update((v.name, v.name) for v in mappings.values())
+
+        indexes = []
+        for v in sorted(mappings.values(), key=lambda x: x._order):
+            if v.unique:
+                indexes.append(Index(v.name, unique=True))
+            elif v.index:
+                indexes.append(Index(v.name))
+        for index in declared:
+            if isinstance(index, str):
+                index = Index(index)
+            elif not isinstance(index, Index):
+                index = Index(*index)
+            indexes.append(index)
+
+        for index in indexes:
+            for field in index.fields:
+                if field not in columns:
+                    raise TypeError('Index field `%s` not defined in table: %s' % (field, table))
+            index.fields = tuple(columns[field] for field in index.fields)
+            if not index.name:
+                index.name = '%s_%s_%s' % ('uk' if index.unique else 'idx', table, '_'.join(index.fields))
+        return indexes
+
+
+class Model(dict, metaclass=ModelMetaclass):
     """
     这是一个基类，用户在子类中 定义映射关系， 因此我们需要动态扫描子类属性 ，
     从中抽取出类属性， 完成 类 <==> 表 的映射， 这里使用 metaclass 来实现。
@@ -90,12 +181,21 @@ class Model(dict, mateclass=ModelMetaclass):
         "__table__" : 表名
         "__mappings__": 字段对象(字段的所有属性，见Field类)
         "__primary_key__": 主键字段
-        "__timestamp_field__": 默认为true，设置是否自动增加update_time和insert_time字段
+        "__timestamp_field__": 默认为False，设置为True时自动增加update_time和insert_time字段(插入时取同一个时间)
+        "__indexes__": 子类中声明的组合索引(见Index类)，和字段上声明的index/unique一起由_get_indexes整理
+        "__database__": 使用哪个注册过的数据库(见register_database)，默认使用db_init初始化的数据库
+    查询方法都可以传入timeout(秒)，超时抛出QueryTimeoutError，默认使用engine的query_timeout
     子类在实例化时，需要完成 实例属性 <==> 行值 的映射， 这里使用 定制dict 来实现。
         Model 从字典继承而来，并且通过"__getattr__","__setattr__"将Model重写，
         使得其像javascript中的 object对象那样，可以通过属性访问 值比如 a.key = value
     """
 
+    __timestamp_field__ = False
+    __database__ = None
+    __write_behind__ = False
+    _deferred = ()
+    _timestamp_fields = ()
+
     def __init__(self, **kw):
         super().__init__(**kw)
 
@@ -109,65 +209,183 @@ class Model(dict, mateclass=ModelMetaclass):
         self[key] = value
 
     @classmethod
-    def get(cls, primary_key):
+    def _get_db(cls):
+        return get_database(cls.__database__)
+
+    @classmethod
+    def write_behind_queue(cls):
+        """
+        延迟写入队列，第一次调用时按__write_behind__的配置创建并缓存在类上(见write_behind.py)
+        """
+        q = cls.__dict__.get('_write_behind_queue')
+        if q is None:
+            with _write_behind_lock:
+                q = cls.__dict__.get('_write_behind_queue')
+                if q is None:
+                    options = cls.__write_behind__ if isinstance(cls.__write_behind__, dict) else {}
+                    q = WriteBehindQueue(cls, **options)
+                    cls._write_behind_queue = q
+        return q
+
+    @classmethod
+    def flush_writes(cls, timeout=None):
+        """
+        等待延迟写入队列里的行写入数据库，超时返回False
+        """
+        q = cls.__dict__.get('_write_behind_queue')
+        return q.flush(timeout) if q is not None else True
+
+    @classmethod
+    def _get_indexes(cls):
+        """
+        整理后的索引，第一次调用时计算并缓存在类上
+        """
+        indexes = cls.__dict__.get('_indexes')
+        if indexes is None:
+            indexes = ModelMetaclass._scan_indexes(cls.__table__, cls.__mappings__, cls.__dict__.get('__indexes__', ()))
+            cls._indexes = indexes
+        return indexes
+
+    @classmethod
+    def _select_columns(cls):
+        """
+        select的字段列表，有延迟读取的大字段(deferred=True)时不查询这些字段，第一次调用时计算并缓存
+        """
+        columns = cls.__dict__.get('_columns')
+        if columns is None:
+            fields = sorted(cls.__mappings__.items(), key=lambda x: x[1]._order)
+            cls._deferred = [(k, v) for k, v in fields if v.deferred]
+            columns = ','.join(['`%s`' % v.name for k, v in fields if not v.deferred]) if cls._deferred else '*'
+            cls._columns = columns
+        return columns
+
+    @classmethod
+    def _from_row(cls, d):
+        """
+        把查询结果转换成实例，延迟读取的大字段换成LargeObject
+        """
+        m = cls(**d)
+        if cls._deferred:
+            pk = d[cls.__primary_key__.name]
+            for k, v in cls._deferred:
+                m[k] = LargeObject(cls, v, pk)
+        return m
+
+    @classmethod
+    def get(cls, primary_key, timeout=None):
         """
         Get by primary key.
         """
-        d = db.select_one('select * from %s where %s=?' % (cls.__table__, cls.__primary_key__.name), primary_key)
-        return cls(**d) if d else None
+        d = cls._get_db().select_one('select %s from %s where %s=?' % (cls._select_columns(), cls.__table__, cls.__primary_key__.name), primary_key, timeout=timeout)
+        return cls._from_row(d) if d else None
 
     @classmethod
-    def find_first(cls, where, *args):
+    def get_many(cls, pks, chunk_size=500, as_dict=False, cache=None, parallel=4, timeout=None):
+        """
+        按主键批量查询，去重后每chunk_size个主键一条 where pk in (?,...) 语句，多条语句时最多parallel个并行执行
+            User.get_many([3, 1, 3, 42]) => [<User 3>, <User 1>, <User 3>, None]
+            User.get_many([3, 42], as_dict=True) => {3: <User 3>, 42: None}
+        按输入顺序返回，不存在的主键为None；主键的类型要和数据库返回的一致(比如都是int)
+        :param cache: 可选的dict或类似对象(身份映射、LRU缓存等)，已经在里面的主键不再查询，查到的行会写进去
+        :param parallel: 并行查询数，每个并行查询占用一个连接；诊断模式(record_queries)下顺序执行
+        """
+        pks = list(pks)
+        keys = list(dict.fromkeys(pks))
+        found = {}
+        if cache is not None:
+            for k in keys:
+                m = cache.get(k)
+                if m is not None:
+                    found[k] = m
+
+        missing = [k for k in keys if k not in found]
+        chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+        pk = cls.__primary_key__.name
+        db = cls._get_db()
+
+        def fetch(chunk):
+            sql = 'select %s from `%s` where `%s` in (%s)' % (cls._select_columns(), cls.__table__, pk,
+                                                            ','.join(['?'] * len(chunk)))
+            return db.select(sql, *chunk, timeout=timeout)
+
+        if len(chunks) > 1 and parallel > 1 and current_recorder() is None:
+            # 线程池是共用的，按parallel把语句分成几组，每组在一个线程里顺序执行，单次调用最多占用parallel个连接
+            def fetch_group(group):
+                return [fetch(chunk) for chunk in group]
+
+            groups = [chunks[i::parallel] for i in range(min(parallel, len(chunks)))]
+            results = []
+            for rows in _get_many_executor(db).map(fetch_group, groups):
+                results.extend(rows)
+        else:
+            results = [fetch(chunk) for chunk in chunks]
+
+        for rows in results:
+            for d in rows:
+                m = cls._from_row(d) if cls._deferred else cls(**d)
+                found[d[pk]] = m
+                if cache is not None:
+                    cache[d[pk]] = m
+
+        if as_dict:
+            return dict((k, found.get(k)) for k in keys)
+        return [found.get(k) for k in pks]
+
+    @classmethod
+    def find_first(cls, where, *args, timeout=None):
         """
         通过where语句进行条件查询，返回1个查询结果。如果有多个查询结果
         仅取第一个，如果没有结果，则返回None
         """
-        d = db.select_one('select * from %s %s' % (cls.__table__, where), *args)
-        return cls(**d) if d else None
+        d = cls._get_db().select_one('select %s from %s %s' % (cls._select_columns(), cls.__table__, where), *args, timeout=timeout)
+        return cls._from_row(d) if d else None
 
     @classmethod
-    def find_all(cls, *args):
+    def find_all(cls, *args, timeout=None):
         """
         查询所有字段， 将结果以一个列表返回
         """
-        ret = db.select('select * from `%s`' % cls.__table__)
-        return [cls(**d) for d in ret]
+        ret = cls._get_db().select('select %s from `%s`' % (cls._select_columns(), cls.__table__), timeout=timeout)
+        return [cls._from_row(d) for d in ret] if cls._deferred else [cls(**d) for d in ret]
 
     @classmethod
-    def find_by(cls, where, *args):
+    def find_by(cls, where, *args, timeout=None):
         """
         通过where语句进行条件查询，将结果以一个列表返回
         """
-        ret = db.select('select * from `%s` %s' % (cls.__table__, where), *args)
-        return [cls(**d) for d in ret]
+        record_lookup(cls.__table__, *where_columns(where))
+        ret = cls._get_db().select('select %s from `%s` %s' % (cls._select_columns(), cls.__table__, where), *args, timeout=timeout)
+        return [cls._from_row(d) for d in ret] if cls._deferred else [cls(**d) for d in ret]
 
     @classmethod
-    def select_by(cls, where, condition=[], fields=[]):
+    def select_by(cls, where, condition=[], fields=[], timeout=None):
         """
         通过where语句进行条件查询，将结果以一个列表返回
         """
         fields = ','.join(fields) if fields else '*'
-        ret = db.select('select %s from `%s` %s' % (fields, cls.__table__, where), *condition)
+        ret = cls._get_db().select('select %s from `%s` %s' % (fields, cls.__table__, where), *condition, timeout=timeout)
         return [cls(**d) for d in ret]
 
     @classmethod
-    def join_by(cls, source_list, source_field, target_field, where=''):
+    def join_by(cls, source_list, source_field, target_field, where='', timeout=None):
         """
         遍历list，拿到field字段，然后批量查询
+        in列表的值作为参数传入，where是不带参数的SQL片段，其中不能出现?和%
         """
         if not source_list:
             return []
 
-        l = []
-        for d in source_list:
-            l.append("'%s'" % d[source_field])
-        where_in_condition = ','.join(l)
+        # in列表的值通过参数传入，由驱动转义，不直接拼进SQL
+        values = list(dict.fromkeys(d[source_field] for d in source_list))
+        where_in_condition = ','.join(['?'] * len(values))
+        record_lookup(cls.__table__, target_field, *where_columns(where))
 
         if where:
             where = '%s and %s in (%s)' % (where, target_field, where_in_condition)
         else:
             where = 'where %s in (%s)' % (target_field, where_in_condition)
-        ret = db.select('select * from `%s` %s' % (cls.__table__, where))
+        ret = cls._get_db().select('select %s from `%s` %s' % (cls._select_columns(), cls.__table__, where), *values,
+                                   timeout=timeout)
 
         for d in source_list:
             d[cls.__table__] = None
@@ -179,25 +397,64 @@ class Model(dict, mateclass=ModelMetaclass):
         return [cls(**d) for d in source_list]
 
     @classmethod
-    def count_all(cls):
+    def load_from(cls, source, fields=None, progress=None, progress_every=bulk.PROGRESS_EVERY):
+        """
+        通过LOAD DATA LOCAL INFILE批量导入，见bulk.load_from
+        """
+        return bulk.load_from(cls, source, fields, progress, progress_every)
+
+    @classmethod
+    def export_to(cls, f, where='', args=(), fields=None, fmt='csv', header=True):
+        """
+        通过服务端游标流式导出成CSV/TSV，见bulk.export_to
+        """
+        return bulk.export_to(cls, f, where, args, fields, fmt, header)
+
+    @classmethod
+    def aggregate(cls, group_by=(), sum=(), avg=(), min=(), max=(), count=False, where='', args=(),
+                  having='', having_args=(), order_by=(), limit=None, columnar=False, timeout=None):
+        """
+        在数据库端分组聚合，只返回聚合结果，见aggregate.py
+            Order.aggregate(group_by='user_id', sum='amount', count=True, order_by=['-sum_amount'], limit=10)
+        :param group_by: 分组字段(属性名)，字符串或列表
+        :param sum/avg/min/max: 聚合字段，字符串或列表，结果列名为 sum_amount 这样的 函数名_属性名
+        :param count: True表示count(*)，列名为count；也可以是字段列表，列名为 count_属性名
+        :param where: where语句，和find_by一样，参数放在args里
+        :param having: having条件(不带having关键字)，可以引用聚合列名，参数放在having_args里
+        :param order_by: 分组字段或聚合列名，前面加'-'表示降序
+        :param columnar: 为True时返回 {列名: [值, ...]}，否则返回namedtuple列表
+        """
+        functions = [(func, field) for func, fields in (('sum', sum), ('avg', avg), ('min', min), ('max', max))
+                     for field in _aggregate.field_list(fields)]
+        if count is True:
+            functions.append(('count', True))
+        else:
+            functions.extend(('count', field) for field in _aggregate.field_list(count))
+        return _aggregate.aggregate(cls, group_by, functions, where, args, having, having_args,
+                                    order_by, limit, columnar, timeout)
+
+    @classmethod
+    def count_all(cls, timeout=None):
         """
         执行 select count(pk) from table语句，返回一个数值
         """
-        return db.select_int('select count(`%s`) from `%s`' % (cls.__primary_key__.name, cls.__table__))
+        return cls._get_db().select_int('select count(`%s`) from `%s`' % (cls.__primary_key__.name, cls.__table__), timeout=timeout)
 
     @classmethod
-    def count_by(cls, where, *args):
+    def count_by(cls, where, *args, timeout=None):
         """
         通过select count(pk) from table where ...语句进行查询， 返回一个数值
         """
-        return db.select_int('select count(`%s`) from `%s` %s' % (cls.__primary_key__.name, cls.__table__, where), *args)
+        record_lookup(cls.__table__, *where_columns(where))
+        return cls._get_db().select_int('select count(`%s`) from `%s` %s' % (cls.__primary_key__.name, cls.__table__, where), *args, timeout=timeout)
 
     @classmethod
-    def count_by_field(cls, where, field, *args):
+    def count_by_field(cls, where, field, *args, timeout=None):
         """
         通过select count(field) from table where ...语句进行查询， 返回一个数值
         """
-        return db.select_int('select count(%s) from `%s` %s' % (field, cls.__table__, where), *args)
+        record_lookup(cls.__table__, *where_columns(where))
+        return cls._get_db().select_int('select count(%s) from `%s` %s' % (field, cls.__table__, where), *args, timeout=timeout)
 
     def update(self):
         """
@@ -222,7 +479,7 @@ class Model(dict, mateclass=ModelMetaclass):
                 args.append(arg)
         pk = self.__primary_key__.name
         args.append(getattr(self, pk))
-        db.update('update `%s` set %s where %s=?' % (self.__table__, ','.join(L), pk), *args)
+        self._get_db().update('update `%s` set %s where %s=?' % (self.__table__, ','.join(L), pk), *args)
         return self
 
     def update_by(self, where, *params):
@@ -237,7 +494,7 @@ class Model(dict, mateclass=ModelMetaclass):
                     L.append('`%s`=?' % k)
                     args.append(arg)
         args.extend(params)
-        db.update('update `%s` set %s %s' % (self.__table__, ','.join(L), where), *args)
+        self._get_db().update('update `%s` set %s %s' % (self.__table__, ','.join(L), where), *args)
         return self
 
     def delete(self):
@@ -248,21 +505,110 @@ class Model(dict, mateclass=ModelMetaclass):
         self.pre_delete and self.pre_delete()
         pk = self.__primary_key__.name
         args = (getattr(self, pk),)
-        db.update('delete from `%s` where `%s`=?' % (self.__table__, pk), *args)
+        self._get_db().update('delete from `%s` where `%s`=?' % (self.__table__, pk), *args)
         return self
 
-    def insert(self):
+    def _fill_defaults(self, fields):
+        """
+        没有赋值的字段使用默认值，自动增加的insert_time和update_time使用同一个时间
+        """
+        now = None
+        for k, v in fields:
+            if not hasattr(self, k):
+                if k in self._timestamp_fields:
+                    if now is None:
+                        now = time.time()
+                    setattr(self, k, now)
+                else:
+                    setattr(self, k, v.default)
+
+    def _snapshot(self):
+        """
+        填好默认值后取出所有可插入字段的值 {属性名: 值}，批量写入和延迟写入队列都按它写入
+        """
+        fields = [(k, v) for k, v in self.__mappings__.items() if v.insertable]
+        self._fill_defaults(fields)
+        row = {}
+        for k, v in fields:
+            value = getattr(self, k)
+            row[k] = check_inline(v, value) if v.deferred else value
+        return row
+
+    def insert(self, deferred=None):
         """
         通过db对象的insert接口执行SQL
             SQL: insert into `user` (`passwd`,`last_modified`,`id`,`name`,`email`) values (%s,%s,%s,%s,%s),
             ARGS: ('******', 1441878476.202391, 10190, 'Michael', 'orm@db.org')
+        如果没有指定主键，把数据库生成的自增主键写回到实例上
+        延迟读取的大字段如果是文件对象或可迭代对象，在同一个事务里先插入空值，再分块写入(见lob.insert_with_streams)
+        :param deferred: 是否放进延迟写入队列，由后台线程批量写入，默认按__write_behind__
         """
-        self.pre_insert and self.pre_insert()
+        getattr(self, 'pre_insert', None) and self.pre_insert()
+        if self.__write_behind__ if deferred is None else deferred:
+            # 放进队列的是此刻各字段值的快照，之后修改实例不会影响写入的内容，后台线程也不会修改实例
+            self.write_behind_queue().put(self._snapshot())
+            return self
+
         params = {}
-        for k, v in self.__mappings__.iteritems():
+        streams = []
+        self._fill_defaults([(k, v) for k, v in self.__mappings__.items() if v.insertable])
+        for k, v in self.__mappings__.items():
             if v.insertable:
-                if not hasattr(self, k):
-                    setattr(self, k, v.default)
-                params[v.name] = getattr(self, k)
-        db.insert('%s' % self.__table__, **params)
+                value = getattr(self, k)
+                if v.deferred and isinstance(value, LargeObject):
+                    continue
+                if v.deferred and is_stream(value):
+                    streams.append((k, v, value))
+                    continue
+                params[v.name] = value
+
+        if streams:
+            lastrowid, lobs = insert_with_streams(self.__class__, params, [(v, value) for k, v, value in streams])
+            for (k, v, value), lob in zip(streams, lobs):
+                setattr(self, k, lob)
+        else:
+            lastrowid = self._get_db().insert('%s' % self.__table__, **params).lastrowid
+
+        pk = self.__primary_key__.name
+        if lastrowid and not params.get(pk):
+            setattr(self, pk, lastrowid)
         return self
+
+    @classmethod
+    def insert_many(cls, models, chunk_size=1000):
+        """
+        批量插入，每chunk_size行拼成一条多行insert语句
+        如果所有实例都没有指定主键，插入时不带主键字段，由数据库生成自增主键，
+        能够确定自增主键时(见DB.insert_many)，把它们写回到各个实例上
+        """
+        if not models:
+            return models
+        for m in models:
+            getattr(m, 'pre_insert', None) and m.pre_insert()
+        return cls._insert_rows(models, chunk_size)
+
+    @classmethod
+    def _insert_rows(cls, models, chunk_size=1000):
+        """
+        insert_many去掉pre_insert的部分
+        """
+        pk = cls.__primary_key__.name
+        auto_pk = not any(dict.get(m, pk) for m in models)
+        ret = cls._insert_snapshots([m._snapshot() for m in models], chunk_size)
+
+        if auto_pk and ret.ids:
+            for m, pk_value in zip(models, ret.ids):
+                setattr(m, pk, pk_value)
+        return models
+
+    @classmethod
+    def _insert_snapshots(cls, rows, chunk_size=1000):
+        """
+        写入_snapshot取出的行，延迟写入队列直接调用，pre_insert已经在放进队列时执行过
+        所有行都没有主键时不带主键字段，由数据库生成自增主键
+        """
+        pk = cls.__primary_key__.name
+        auto_pk = not any(row.get(pk) for row in rows)
+        fields = [(k, v) for k, v in cls.__mappings__.items() if v.insertable and not (auto_pk and v.name == pk)]
+        values = [[row[k] for k, v in fields] for row in rows]
+        return cls._get_db().insert_many(cls.__table__, [v.name for k, v in fields], values, chunk_size)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+根据Model的__mappings__和__indexes__生成建表语句，并和数据库中实际的索引做对比
+
+Model的find_by/join_by/count_by等方法会把where中用到的字段记录下来(record_lookup)，
+diff_indexes 会报告:
+    1. Model中声明了但数据库里没有的索引
+    2. 查询中用到了、但不是任何索引第一个字段的列
+"""
+
+import re
+import functools
+from collections import namedtuple, defaultdict
+
+IndexReport = namedtuple('IndexReport', ['table', 'missing_indexes', 'unindexed_lookups'])
+
+_WHERE_COLUMN_RE = re.compile(r'`?(\w+)`?\s*(?:<=>|!=|<>|<=|>=|=|<|>|\bin\b|\blike\b|\bbetween\b|\bis\b)', re.I)
+
+_lookups = defaultdict(set)
+
+
+@functools.lru_cache(maxsize=1024)
+def where_columns(where):
+    """
+    从where语句中找出参与比较的字段名
+    :param where: str
+    :return: tuple
+    """
+    return tuple(set(_WHERE_COLUMN_RE.findall(where or '')))
+
+
+def record_lookup(table, *columns):
+    """
+    记录查询条件中用到的字段
+    """
+    if columns:
+        _lookups[table].update(columns)
+
+
+def lookups(table):
+    return frozenset(_lookups.get(table, ()))
+
+
+def gen_sql(model):
+    """
+    按字段定义的顺序(Field._order)生成建表语句
+    :param model: Model的子类
+    :return: str
+    """
+    sql = ['-- generating SQL for %s:' % model.__table__, 'create table `%s` (' % model.__table__]
+    for f in sorted(model.__mappings__.values(), key=lambda x: x._order):
+        if not f.ddl:
+            raise TypeError('no ddl in field "%s".' % f.name)
+        sql.append('  `%s` %s,' % (f.name, f.ddl) if f.nullable else '  `%s` %s not null,' % (f.name, f.ddl))
+    sql.append('  primary key(`%s`)' % model.__primary_key__.name)
+    for index in model._get_indexes():
+        sql[-1] += ','
+        sql.append('  %s `%s` (%s)' % ('unique key' if index.unique else 'key', index.name, _columns_sql(index.fields)))
+    sql.append(');')
+    return '\n'.join(sql)
+
+
+def index_sql(table, index):
+    """
+    生成给已有的表增加索引的语句
+    """
+    return 'alter table `%s` add %s `%s` (%s);' % (table, 'unique key' if index.unique else 'key', index.name, _columns_sql(index.fields))
+
+
+def existing_indexes(db, table):
+    """
+    从information_schema中读取表上已有的索引
+    :return: dict 索引名 => 字段元组
+    """
+    rows = db.select('select `index_name` as index_name, `column_name` as column_name '
+                     'from information_schema.statistics '
+                     'where `table_schema`=database() and `table_name`=? '
+                     'order by `index_name`, `seq_in_index`', table)
+    indexes = {}
+    for r in rows:
+        indexes.setdefault(r['index_name'], []).append(r['column_name'])
+    return dict((k, tuple(v)) for k, v in indexes.items())
+
+
+def diff_indexes(db, *models):
+    """
+    对比Model和数据库中的索引，只返回有问题的表
+    :param db: DB instance
+    :param models: Model的子类
+    :return: list of IndexReport
+    """
+    reports = []
+    for model in models:
+        existing = list(existing_indexes(db, model.__table__).values())
+        columns = set(v.name for v in model.__mappings__.values())
+
+        missing = [index for index in model._get_indexes()
+                   if not any(cols[:len(index.fields)] == index.fields for cols in existing)]
+        leading = set(cols[0] for cols in existing) | set(index.fields[0] for index in missing)
+        unindexed = sorted(c for c in lookups(model.__table__) if c in columns and c not in leading)
+
+        if missing or unindexed:
+            reports.append(IndexReport(model.__table__, missing, unindexed))
+    return reports
+
+
+def _columns_sql(fields):
+    return ','.join(['`%s`' % field for field in fields])
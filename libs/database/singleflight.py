@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+合并同时发出的相同读请求(single flight)
+热点行缓存失效时，大量线程会在同一时刻执行完全相同的查询，每个都占用一个连接；
+开启后同一个key只有第一个调用者真正执行，其余调用者等待它的结果:
+    engine = create_engine(..., single_flight=True)   # DB.select/select_one默认合并
+    db.select(sql, *args, coalesce=False)             # 单次调用不合并
+    await db.select_async(sql, *args)                 # asyncio里使用，查询在线程池中执行
+
+有等待者时每个调用者(包括执行查询的那个)拿到的都是结果的浅拷贝(列表和每一行都会复制)，修改结果不会影响其他调用者；
+执行出错时每个等待者收到该异常的一个副本(__cause__是原始异常)，不会共用同一个异常对象的traceback
+fork之后子进程使用新的锁和调用表，不会等待父进程里正在执行的调用
+只合并已经在执行中的查询，不缓存结果；在自己刚写入之后读取时，可能拿到写入之前就开始的那次查询的结果
+"""
+
+import os
+import copy
+import asyncio
+import contextvars
+import threading
+
+from . import metrics
+
+__all__ = ['SingleFlight', 'SingleFlightError', 'flight_key']
+
+
+class SingleFlightError(Exception):
+    """
+    原始异常不能复制时等待者收到的异常，__cause__是原始异常
+    """
+
+
+def flight_key(sql, first, args):
+    """
+    合并的key: 压缩空白后的SQL、是否只取第一行和参数，参数不可哈希时返回None(不合并)
+    """
+    key = (' '.join(sql.split()), first, args)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _copy_result(result):
+    if isinstance(result, list):
+        return [copy.copy(row) for row in result]
+    if isinstance(result, dict):
+        return copy.copy(result)
+    return result
+
+
+class _Call(object):
+    __slots__ = ('done', 'result', 'error', 'callbacks', 'shared')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.callbacks = []
+        self.shared = False
+
+    def outcome(self):
+        if self.error is not None:
+            # 每个等待者抛出自己的副本，共享的异常对象上不会叠加各个线程的traceback
+            try:
+                err = copy.copy(self.error)
+            except Exception:
+                err = SingleFlightError('Shared call failed: %r' % (self.error,))
+            raise err from self.error
+        return _copy_result(self.result)
+
+
+class SingleFlight(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._pid = os.getpid()
+
+    def __len__(self):
+        return len(self._calls)
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # 父进程里正在执行的调用不会在子进程里完成，锁也可能在fork时被其他线程持有
+            self._lock = threading.Lock()
+            self._calls = {}
+            self._pid = os.getpid()
+
+    def do(self, key, func):
+        """
+        key相同的调用正在执行时等待它的结果，否则执行func
+        """
+        self._check_fork()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.shared = True
+
+        if not leader:
+            metrics.incr('single_flight_shared')
+            call.done.wait()
+            return call.outcome()
+
+        try:
+            call.result = func()
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            # 移除和完成在同一把锁里，之后来的调用者不会再挂到这次调用上
+            with self._lock:
+                del self._calls[key]
+                call.done.set()
+            for callback in call.callbacks:
+                try:
+                    callback()
+                except RuntimeError:
+                    # 等待的事件循环已经关闭
+                    pass
+        # call.result留给等待者复制，不交给任何调用者；移除之后不会再有新的等待者，没有等待者时不用复制
+        return _copy_result(call.result) if call.shared else call.result
+
+    async def do_async(self, key, func, executor=None):
+        """
+        asyncio版本: 第一个调用者在线程池(executor)中执行func，其余调用者(线程或协程)等待它的结果，等待时不占用线程
+        """
+        loop = asyncio.get_running_loop()
+        future = None
+        self._check_fork()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                future = loop.create_future()
+                call.shared = True
+                call.callbacks.append(lambda: loop.call_soon_threadsafe(_resolve, future))
+
+        if future is None:
+            # 在调用方上下文的副本里执行，诊断模式的记录器等contextvars在线程池里同样可见
+            return await loop.run_in_executor(executor, contextvars.copy_context().run, self.do, key, func)
+
+        metrics.incr('single_flight_shared')
+        await future
+        return call.outcome()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
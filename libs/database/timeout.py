@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+语句超时
+    1. select语句加上 MAX_EXECUTION_TIME 提示，由服务端中断(MySQL 5.7.8+)
+    2. 客户端看门狗: 超时后通过一个单独的连接发送 KILL QUERY，适用于所有语句
+超时抛出QueryTimeoutError，连接正常归还连接池，并计入metrics的query_timeout
+"""
+
+import os
+import re
+import heapq
+import logging
+import threading
+from time import monotonic
+
+from . import metrics
+
+logger = logging.getLogger('pymysql')
+
+# ER_QUERY_TIMEOUT: MAX_EXECUTION_TIME 超时; ER_QUERY_INTERRUPTED: 被KILL QUERY中断
+TIMEOUT_ERROR_CODES = (3024, 1317)
+
+# select已经有服务端超时，看门狗晚一点再动手
+WATCHDOG_GRACE = 0.5
+
+_SELECT_RE = re.compile(r'^(\s*select)\b(?!\s*/\*\+)', re.I)
+
+
+class QueryTimeoutError(Exception):
+    pass
+
+
+def with_max_execution_time(sql, timeout):
+    """
+    给select语句加上MAX_EXECUTION_TIME提示，其他语句原样返回
+    :return: tuple (sql, 是否加上了提示)
+    """
+    hinted, n = _SELECT_RE.subn(r'\1 /*+ MAX_EXECUTION_TIME(%d) */' % max(1, int(timeout * 1000)), sql, count=1)
+    return hinted, bool(n)
+
+
+class _Scheduler(object):
+    """
+    所有Watchdog共用的一个后台线程，按截止时间排成小顶堆，只在最早的截止时间醒来
+    取消的条目只做标记，出堆时跳过；取消的条目超过一半时重建堆
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._heap = []
+        self._seq = 0
+        self._cancelled = 0
+        self._thread = None
+        self._pid = None
+
+    def schedule(self, deadline, watchdog):
+        with self._cond:
+            if self._pid != os.getpid():
+                # fork之后后台线程不存在了，丢掉父进程的条目
+                self._heap = []
+                self._cancelled = 0
+                self._thread = None
+                self._pid = os.getpid()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name='query-watchdog')
+                self._thread.start()
+            self._seq += 1
+            entry = [deadline, self._seq, watchdog]
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                self._cond.notify()
+            return entry
+
+    def cancel(self, entry):
+        with self._cond:
+            if entry[2] is None:
+                return
+            entry[2] = None
+            self._cancelled += 1
+            if self._cancelled > len(self._heap) // 2:
+                self._heap = [e for e in self._heap if e[2] is not None]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    while self._heap and self._heap[0][2] is None:
+                        heapq.heappop(self._heap)
+                        self._cancelled -= 1
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    remaining = self._heap[0][0] - monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                entry = heapq.heappop(self._heap)
+                watchdog, entry[2] = entry[2], None
+            # KILL QUERY要新建连接，放到单独的线程里，不耽误后面的截止时间
+            threading.Thread(target=watchdog._kill, daemon=True, name='query-kill').start()
+
+
+_scheduler = _Scheduler()
+
+
+class Watchdog(object):
+    """
+    with块内的语句超过timeout秒(再加上grace)还没有结束时，通过连接池发送KILL QUERY
+    截止时间登记在共用的后台线程上(见_Scheduler)，不为每条语句创建线程
+    KILL QUERY期间持有锁，语句结束时要先拿到锁，保证KILL不会落到这个连接之后执行的语句上
+    """
+
+    def __init__(self, pool, conn, timeout, sql=None, grace=0):
+        self._pool = pool
+        self._conn = conn
+        self._timeout = timeout
+        self._grace = grace
+        self._sql = sql
+        self._lock = threading.Lock()
+        self._done = False
+        self._killed = False
+        self._entry = None
+
+    def __enter__(self):
+        self._entry = _scheduler.schedule(monotonic() + self._timeout + self._grace, self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _scheduler.cancel(self._entry)
+        with self._lock:
+            self._done = True
+
+        if exc_val is None:
+            if self._killed:
+                # 语句在KILL之前已经结束，清掉连接上可能残留的中断标记
+                self._drain()
+            return False
+
+        if not (self._killed or _is_timeout(exc_val)):
+            return False
+
+        metrics.incr('query_timeout')
+        logger.warning('SQL: Query timeout after %ss: %s', self._timeout, self._sql)
+        raise QueryTimeoutError('Query exceeded %ss timeout' % self._timeout) from exc_val
+
+    def _kill(self):
+        with self._lock:
+            if self._done:
+                return
+            self._killed = True
+            try:
+                self._pool.kill_query(self._conn.thread_id())
+            except Exception as err:
+                logger.error('Failed to kill query: %s', err)
+
+    def _drain(self):
+        try:
+            cursor = self._conn.cursor()
+            try:
+                cursor.execute('select 1')
+                cursor.fetchall()
+            finally:
+                cursor.close()
+        except Exception as err:
+            if not _is_timeout(err):
+                raise err
+
+
+class _NoWatchdog(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+NO_WATCHDOG = _NoWatchdog()
+
+
+def _is_timeout(err):
+    args = getattr(err, 'args', ())
+    return bool(args) and args[0] in TIMEOUT_ERROR_CODES
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Knows'
+
+"""
+只追加、写入后不会马上读取的Model(审计日志、事件等)的延迟写入:
+    class AuditLog(Model):
+        __write_behind__ = True                      # 或者传入WriteBehindQueue的参数:
+        __write_behind__ = {'batch_size': 200, 'flush_interval': 0.5, 'on_error': report}
+
+    AuditLog(action='login').insert()                # 放进队列后立即返回
+    User(name='x').insert(deferred=True)             # 单次调用使用延迟写入
+    AuditLog.flush_writes()                          # 等待已经放进队列的行写入数据库
+
+每个Model一个有界队列和一个后台线程，攒够batch_size行或者等待flush_interval秒后用一条多行insert写入(见Model.insert_many)
+队列满时put阻塞等待(backpressure)，超过put_timeout抛出WriteBehindQueueFull；进程退出时写完队列里剩下的行
+队列里放的是insert()时各字段值的快照({属性名: 值})，不是Model实例，之后修改实例不会影响写入的内容
+写入失败时调用on_error(err, rows)，rows是这些快照，没有设置on_error时记录日志，失败的行不会重试
+延迟写入的行不会写回自增主键，大字段也不能是文件对象或可迭代对象
+"""
+
+import os
+import atexit
+import logging
+import threading
+import queue
+from time import monotonic
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['WriteBehindQueue', 'WriteBehindQueueFull', 'flush_all']
+
+_queues = []
+_queues_lock = threading.Lock()
+
+
+class WriteBehindQueueFull(Exception):
+    pass
+
+
+class _Flush(object):
+    """
+    放在队列里的标记，后台线程遇到它时立即写入当前批次
+    """
+
+    def __init__(self, stop=False):
+        self.stop = stop
+        self.done = threading.Event()
+
+
+class WriteBehindQueue(object):
+
+    def __init__(self, model, max_size=10000, batch_size=500, flush_interval=1.0, put_timeout=None, on_error=None):
+        """
+        :param model: Model类
+        :param max_size: 队列里最多缓存的行数
+        :param batch_size: 每条insert语句最多写入的行数
+        :param flush_interval: 第一行进入队列后最多等待多少秒写入
+        :param put_timeout: 队列满时put最多阻塞多少秒，None表示一直等待
+        :param on_error: 写入失败时的回调 on_error(err, rows)
+        """
+        if batch_size < 1 or max_size < batch_size:
+            raise ValueError('Invalid write behind queue size {} / batch size {}'.format(max_size, batch_size))
+        self.model = model
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.on_error = on_error
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        with _queues_lock:
+            _queues.append(self)
+
+    def __repr__(self):
+        return '<WriteBehindQueue model={}, pending={}>'.format(self.model.__name__, self.pending)
+
+    @property
+    def pending(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def put(self, row):
+        """
+        放入一行(Model._snapshot取出的 {属性名: 值})，队列满时阻塞等待
+        """
+        q = self._ensure_started()
+        try:
+            q.put(row, True, self.put_timeout)
+        except queue.Full:
+            metrics.incr('write_behind_full')
+            raise WriteBehindQueueFull('[{}] Write behind queue is full ({} rows)'.format(self.model.__name__,
+                                                                                      self.max_size))
+
+    def flush(self, timeout=None):
+        """
+        等待调用之前放入的行全部写入，超时返回False
+        """
+        return self._send(_Flush(), timeout)
+
+    def close(self, timeout=None):
+        """
+        写完剩下的行并停止后台线程，之后再put会重新启动
+        """
+        with self._lock:
+            thread = self._thread
+            if thread is None or self._pid != os.getpid():
+                return True
+            done = self._send(_Flush(stop=True), timeout)
+            if done:
+                thread.join(timeout)
+                self._thread = None
+            return done
+
+    def _send(self, marker, timeout):
+        if self._queue is None or self._pid != os.getpid():
+            return True
+        # 标记不受max_size限制，不会被队列满阻塞
+        with self._queue.mutex:
+            self._queue.queue.append(marker)
+            self._queue.unfinished_tasks += 1
+            self._queue.not_empty.notify()
+        return marker.done.wait(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return self._queue
+        with self._lock:
+            if self._pid != os.getpid():
+                # fork之前放入的行由父进程写入，子进程使用新的队列
+                self._queue = queue.Queue(self.max_size)
+                self._thread = None
+                self._pid = os.getpid()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True,
+                                                name='write-behind-%s' % self.model.__name__)
+                self._thread.start()
+        return self._queue
+
+    def _run(self):
+        q = self._queue
+        while True:
+            rows = []
+            marker = None
+            item = q.get()
+            deadline = monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, _Flush):
+                    marker = item
+                    break
+                rows.append(item)
+                if len(rows) >= self.batch_size:
+                    break
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = q.get(True, remaining)
+                except queue.Empty:
+                    break
+
+            if rows:
+                self._write(rows)
+            for _ in range(len(rows) + (marker is not None)):
+                q.task_done()
+            if marker is not None:
+                marker.done.set()
+                if marker.stop:
+                    return
+
+    def _write(self, rows):
+        try:
+            self.model._insert_snapshots(rows, self.batch_size)
+        except Exception as err:
+            metrics.incr('write_behind_error')
+            if self.on_error is None:
+                logger.exception('[%s] Write behind insert of %s rows failed', self.model.__name__, len(rows))
+            else:
+                try:
+                    self.on_error(err, rows)
+                except Exception:
+                    logger.exception('[%s] Write behind error callback failed', self.model.__name__)
+        else:
+            metrics.incr('write_behind_rows', len(rows))
+
+
+def flush_all(timeout=None):
+    """
+    写完所有延迟写入队列里的行，进程退出时自动调用
+    """
+    with _queues_lock:
+        queues = list(_queues)
+    return all([q.close(timeout) for q in queues])
+
+
+atexit.register(flush_all)
@@ -16,17 +16,18 @@ def sql_profiling_decorator(func):
     @functools.wraps(func)
     def _wrapper(*args, **kw):
         start = time.time()
-        t = time.time() - start
         try:
             ret = func(*args, **kw)
 
         except Exception:
-            log_info = 'SQL: Execute Failed! %s, ARGS: %s; Execution time: %sms' % (args[1], args[2:], t)
+            t = (time.time() - start) * 1000
+            log_info = 'SQL: Execute Failed! %s, ARGS: %s; Execution time: %.2fms' % (args[1], args[2:], t)
             logging.warning(log_info)
-            raise Exception
+            raise
         else:
-            log_info = 'SQL: %s, ARGS: %s; Execution time: %sms' % (args[1], args[2:], t)
-            if t > 0.1:
+            t = (time.time() - start) * 1000
+            log_info = 'SQL: %s, ARGS: %s; Execution time: %.2fms' % (args[1], args[2:], t)
+            if t > 100:
                 logging.warning(log_info)
             else:
                 logging.info(log_info)